@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import suppress
+
+import metrics
+
+logger = logging.getLogger("background")
+
+# the owner of task leases taken by this process
+WORKER_ID = uuid.uuid4().hex
+
+
+class PeriodicTask:
+    # runs `job` every `interval` seconds on the event loop of the app, started and stopped by the lifespan;
+    # a failed run is logged and the task carries on with the next one
+    def __init__(self, name: str, interval: float, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self._task = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name=self.name)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def run_once(self):
+        started = time.perf_counter()
+        try:
+            return await self.job()
+        except Exception:
+            metrics.background_task_failures.inc(self.name)
+            logger.exception("periodic task %s failed", self.name)
+        finally:
+            metrics.background_task_duration.observe(time.perf_counter() - started, self.name)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
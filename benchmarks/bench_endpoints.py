@@ -0,0 +1,172 @@
+"""Benchmark the API in-process at several data sizes and concurrency levels.
+
+Run from the project root:
+
+    python -m benchmarks.bench_endpoints --sizes 1000 10000 --concurrency 1 16
+    python -m benchmarks.bench_endpoints --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_endpoints --baseline benchmarks/baseline.json --threshold 0.25
+
+Each data size runs in its own interpreter against a freshly generated temporary database,
+requests go through httpx's ASGI transport, so no server is started.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# endpoint name, method, path, whether it needs an admin token
+ENDPOINTS = [
+    ("token", "POST", "/token", False),
+    ("me", "GET", "/users/me/", False),
+    ("me_salary", "GET", "/users/me/salary/", False),
+    ("me_promotion", "GET", "/users/me/promotion/", False),
+    ("me_compensation", "GET", "/users/me/compensation/?history=12", False),
+    ("admin_employees", "GET", "/admin/employees/?limit=100", True),
+    ("admin_salaries", "GET", "/admin/salaries/?limit=100", True),
+    ("admin_promotions", "GET", "/admin/promotions/?limit=100", True),
+]
+# every login is a bcrypt verification, so /token gets fewer requests
+TOKEN_REQUESTS_FACTOR = 0.1
+PASSWORD = "password"
+USERS = 100
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def measure(client, method: str, path: str, headers: list, data: list, concurrency: int,
+                  requests: int) -> dict:
+    latencies, errors = [], 0
+    started = time.perf_counter()
+
+    async def worker(number: int):
+        nonlocal errors
+        for i in range(number, requests, concurrency):
+            request_started = time.perf_counter()
+            response = await client.request(method, path, headers=headers[i % len(headers)],
+                                            data=data[i % len(data)] if data else None)
+            latencies.append(time.perf_counter() - request_started)
+            # a user without a promotion gets 404, that is a valid answer
+            if response.status_code >= 500 or response.status_code in (401, 403):
+                errors += 1
+
+    await asyncio.gather(*[worker(number) for number in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {"p50": percentile(latencies, 0.50) * 1000, "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000, "rps": len(latencies) / elapsed, "errors": errors}
+
+
+async def run_size(concurrency_levels: list, requests: int) -> dict:
+    # imported here, the database url must be in the environment before settings is loaded
+    import httpx
+    import sqlalchemy as sa
+
+    import hashing
+    import main
+    import models
+    import settings
+
+    with settings.get_engine().connect() as connection:
+        employees = connection.execute(sa.select(models.Employee).order_by(models.Employee.id).limit(USERS)).all()
+        admin = connection.execute(sa.select(models.Employee).where(models.Employee.is_admin)).first()
+    tokens = {False: [main.create_access_token(main.access_token_claims(user)) for user in employees],
+              True: [main.create_access_token(main.access_token_claims(admin))]}
+    logins = [{"grant_type": "password", "username": user.username, "password": PASSWORD} for user in employees]
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, method, path, admin_only in ENDPOINTS:
+            headers = [{"Authorization": f"Bearer {token}"} for token in tokens[admin_only]]
+            count = max(concurrency_levels[-1], int(requests * TOKEN_REQUESTS_FACTOR)) if name == "token" else requests
+            # warm up caches and the connection pool before measuring
+            await measure(client, method, path, headers, logins if name == "token" else None,
+                          concurrency_levels[-1], concurrency_levels[-1])
+            for concurrency in concurrency_levels:
+                results[f"{name}/c{concurrency}"] = await measure(
+                    client, method, path, headers, logins if name == "token" else None, concurrency, count)
+    hashing.pool.shutdown()
+    await settings.dispose_engines()
+    return results
+
+
+def generate(path: str, employees: int):
+    import fill_db
+    import migrations
+    import settings
+
+    engine = settings.create_engine(f"sqlite:///{path}", pragmas=fill_db.BULK_LOAD_PRAGMAS, echo=False)
+    migrations.upgrade(engine)
+    fill_db.generate(engine, fill_db.Distribution(employees=employees, admin_rate=0.01), seed=0, password=PASSWORD)
+    engine.dispose()
+
+
+def run(size: int, concurrency_levels: list, requests: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        generate(path, size)
+        # every login comes from the same client address, the login rate limiter would turn them away
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", DB_ECHO="0", LOGIN_RATE_LIMIT_BACKEND="none")
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_endpoints", "--worker", "--requests", str(requests),
+             "--concurrency", *map(str, concurrency_levels)],
+            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        expected = baseline[key]
+        if result["p95"] > expected["p95"] * (1 + threshold):
+            regressions.append(f"{key}: p95 {result['p95']:.1f} ms, baseline {expected['p95']:.1f} ms")
+        if result["rps"] < expected["rps"] * (1 - threshold):
+            regressions.append(f"{key}: {result['rps']:.0f} rps, baseline {expected['rps']:.0f} rps")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="number of employees")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint and concurrency level")
+    parser.add_argument("--baseline", help="fail when results regress against this file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression, 0.25 is 25%%")
+    parser.add_argument("--save-baseline", help="write the results to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_size(sorted(args.concurrency), args.requests))))
+        return
+
+    results = {}
+    print(f"{'benchmark':<32} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rps':>8} {'errors':>7}")
+    for size in args.sizes:
+        for key, result in run(size, sorted(args.concurrency), args.requests).items():
+            results[f"{size}/{key}"] = result
+            print(f"{size}/{key:<{31 - len(str(size))}} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                  f"{result['p99']:>8.2f} {result['rps']:>8.0f} {result['errors']:>7}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            sys.exit("regressions:\n" + "\n".join(regressions))
+    if any(result["errors"] for result in results.values()):
+        sys.exit("some requests failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare concurrent read/write throughput of the default and the tuned SQLite engine settings.
+
+Run from the project root:
+
+    python -m benchmarks.bench_engine --readers 16 --writers 4 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import models
+import schemas
+import settings
+
+EMPLOYEES = 1000
+
+# what the engine used before: rollback journal, full fsync, driver defaults
+DEFAULT_PRAGMAS = ["journal_mode=DELETE", "synchronous=FULL"]
+
+
+def seed(path: str, rows: int):
+    engine = sa.create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as connection:
+        connection.execute(sa.insert(models.Employee),
+                           [{"username": f"user{i}", "password": ""} for i in range(EMPLOYEES)])
+        connection.execute(sa.insert(models.Salary), [
+            {"employee_id": i % EMPLOYEES + 1, "total": 1000 + i % 500, "created_at": now,
+             "received_at": now + timedelta(days=i % 365), "is_received": False}
+            for i in range(rows)
+        ])
+    engine.dispose()
+
+
+async def reader(session_factory, deadline: float, counts: dict, number: int):
+    while time.perf_counter() < deadline:
+        async with session_factory() as db:
+            try:
+                await crud.get_own_salary(db, (number * 7919 + counts["reads"]) % EMPLOYEES + 1)
+                counts["reads"] += 1
+            except OperationalError:
+                counts["errors"] += 1
+
+
+async def writer(session_factory, deadline: float, counts: dict, number: int):
+    salary = schemas.SalaryCreate(employee_id=number % EMPLOYEES + 1, total=1000, received_at=datetime.now())
+    while time.perf_counter() < deadline:
+        async with session_factory() as db:
+            try:
+                await crud.create_salary(db, salary)
+                counts["writes"] += 1
+            except OperationalError:
+                counts["errors"] += 1
+
+
+async def run(path: str, tuned: bool, readers: int, writers: int, seconds: float) -> dict:
+    url = f"sqlite:///{path}"
+    pool_size = readers + writers
+    write_engine = settings.create_async_db_engine(
+        url, pragmas=None if tuned else DEFAULT_PRAGMAS, echo=False, pool_size=pool_size)
+    read_engine = settings.create_async_db_engine(url, read_only=True, echo=False, pool_size=pool_size) \
+        if tuned else write_engine
+    write_sessions = async_sessionmaker(write_engine, autoflush=False, expire_on_commit=False)
+    read_sessions = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*[reader(read_sessions, deadline, counts, i) for i in range(readers)],
+                         *[writer(write_sessions, deadline, counts, i) for i in range(writers)])
+    await write_engine.dispose()
+    await read_engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'engine':>8} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+    for tuned in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.db")
+            seed(path, args.rows)
+            counts = asyncio.run(run(path, tuned, args.readers, args.writers, args.seconds))
+        print(f"{'tuned' if tuned else 'default':>8} {counts['reads'] / args.seconds:>10.0f} "
+              f"{counts['writes'] / args.seconds:>10.0f} {counts['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure /users/me/salary/ latency while /token is flooded with bad logins.
+
+Run from the project root:
+
+    python -m benchmarks.bench_login_attack
+    python -m benchmarks.bench_login_attack --attack-rps 500 --requests 1000
+
+The attack is a fixed rate of bad logins for existing usernames from one IP, salary latency is measured
+once the attack has been running for --warmup seconds. Every scenario runs in its own interpreter, so the
+limiter settings are read fresh: "baseline" without an attack, then the attack with the limiter off, with
+the default limits and with loose per-IP limits of the kind a test suite logging in from one address needs.
+With the defaults only the burst reaches bcrypt, and that is spent during the warmup.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_endpoints import generate, percentile
+
+# name, whether /token is attacked, environment of the scenario
+SCENARIOS = [
+    ("baseline", False, {}),
+    ("attack, no limiter", True, {"LOGIN_RATE_LIMIT_BACKEND": "none"}),
+    ("attack, default limiter", True, {"LOGIN_RATE_LIMIT_BACKEND": "memory"}),
+    ("attack, loose limiter", True, {"LOGIN_RATE_LIMIT_BACKEND": "memory", "LOGIN_RATE_LIMIT_IP_BURST": "100",
+                                     "LOGIN_RATE_LIMIT_IP_PER_MINUTE": "600"}),
+]
+
+
+async def run_scenario(attackers: int, attack_rps: float, warmup: float, requests: int) -> dict:
+    # imported here, the database url and limiter backend must be in the environment before settings is loaded
+    import httpx
+    import sqlalchemy as sa
+
+    import hashing
+    import main
+    import models
+    import settings
+
+    with settings.get_engine().connect() as connection:
+        employees = connection.execute(sa.select(models.Employee).order_by(models.Employee.id).limit(100)).all()
+    headers = [{"Authorization": f"Bearer {main.create_access_token(main.access_token_claims(user))}"}
+               for user in employees]
+    usernames = [user.username for user in employees]
+
+    statuses = {}
+    latencies = []
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=main.app, client=("203.0.113.7", 40000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def attacker(number: int):
+            i = number
+            while not done.is_set():
+                response = await client.post("/token", data={"username": usernames[i % len(usernames)],
+                                                             "password": "wrong"})
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                i += attackers
+                await asyncio.sleep(attackers / attack_rps)
+
+        async def victim():
+            for i in range(requests):
+                started = time.perf_counter()
+                response = await client.get("/users/me/salary/", headers=headers[i % len(headers)])
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code in (200, 404)
+                # a dashboard polling, not a load test
+                await asyncio.sleep(0.002)
+            done.set()
+
+        tasks = [asyncio.create_task(attacker(number)) for number in range(attackers)]
+        # lets the limiter use up its burst, that part of the attack still reaches bcrypt
+        await asyncio.sleep(warmup if attackers else 0)
+        await victim()
+        await asyncio.gather(*tasks)
+    hashing.pool.shutdown()
+    await settings.dispose_engines()
+    return {"p50": percentile(latencies, 0.50) * 1000, "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000, "logins": statuses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--attackers", type=int, default=16, help="concurrent bad login loops")
+    parser.add_argument("--attack-rps", type=float, default=200, help="bad logins per second, all loops together")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of attack before measuring")
+    parser.add_argument("--requests", type=int, default=500, help="salary requests measured per scenario")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_scenario(args.attackers, args.attack_rps, args.warmup, args.requests))))
+        return
+
+    print(f"{'scenario':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  logins by status")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        generate(path, args.employees)
+        for name, attacked, scenario_env in SCENARIOS:
+            # limits from the calling shell would hide the defaults
+            env = {key: value for key, value in os.environ.items() if not key.startswith("LOGIN_RATE_LIMIT_")}
+            env.update(DATABASE_URL=f"sqlite:///{path}", DB_ECHO="0", **scenario_env)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_login_attack", "--worker", "--requests", str(args.requests),
+                 "--attackers", str(args.attackers if attacked else 0),
+                 "--attack-rps", str(args.attack_rps), "--warmup", str(args.warmup)],
+                env=env, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<24} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['p99']:>8.2f}  {result['logins']}")
+
+
+if __name__ == "__main__":
+    main()
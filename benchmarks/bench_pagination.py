@@ -0,0 +1,85 @@
+"""Compare offset and keyset pagination of salaries at increasing page depth.
+
+Run from the project root:
+
+    python -m benchmarks.bench_pagination --rows 1200000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import crud
+import models
+
+FIELDS = [column.name for column in models.Salary.__table__.columns]
+
+
+def seed(path: str, rows: int, batch_size: int = 50000):
+    engine = sa.create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as connection:
+        connection.execute(sa.insert(models.Employee), [{"username": f"user{i}", "password": ""} for i in range(1000)])
+        for start in range(0, rows, batch_size):
+            connection.execute(sa.insert(models.Salary), [
+                {"employee_id": i % 1000 + 1, "total": 1000 + i % 500, "created_at": now,
+                 "received_at": now + timedelta(days=i % 365), "is_received": False}
+                for i in range(start, min(start + batch_size, rows))
+            ])
+    engine.dispose()
+
+
+async def measure(session_factory, depth: int, limit: int, repeat: int):
+    offset_times, keyset_times = [], []
+    async with session_factory() as db:
+        # the id just before the requested page, as a client following cursors would have it
+        after_id = None
+        if depth:
+            after_id = (await crud.get_rows(db, models.Salary, ["id"], skip=depth * limit - 1, limit=1))[0].id
+        for _ in range(repeat):
+            started = time.perf_counter()
+            by_offset = await crud.get_rows(db, models.Salary, FIELDS, skip=depth * limit, limit=limit)
+            offset_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            by_keyset = await crud.get_rows(db, models.Salary, FIELDS, limit=limit, after_id=after_id)
+            keyset_times.append(time.perf_counter() - started)
+            assert [s.id for s in by_offset] == [s.id for s in by_keyset]
+    return statistics.median(offset_times), statistics.median(keyset_times)
+
+
+async def run(path: str, depths, limit: int, repeat: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    print(f"{'page':>8} {'offset ms':>10} {'keyset ms':>10} {'speedup':>8}")
+    for depth in depths:
+        offset_time, keyset_time = await measure(session_factory, depth, limit, repeat)
+        print(f"{depth:>8} {offset_time * 1000:>10.2f} {keyset_time * 1000:>10.2f} {offset_time / keyset_time:>7.1f}x")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_200_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 100, 1000, 5000, 10000, 11999])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        started = time.perf_counter()
+        seed(path, args.rows)
+        print(f"seeded {args.rows} salaries in {time.perf_counter() - started:.1f}s")
+        asyncio.run(run(path, [d for d in args.depths if d * args.limit < args.rows], args.limit, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
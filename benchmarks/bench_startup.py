@@ -0,0 +1,58 @@
+"""Measure cold-start time: importing the app and running its startup against a migrated database.
+
+Run from the project root:
+
+    python -m benchmarks.bench_startup --repeat 5 --max-seconds 2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# runs in a fresh interpreter each time, so nothing is warmed up by earlier runs
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def start():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+print(json.dumps({"import": imported - started, "startup": ready - imported}))
+"""
+
+
+def probe(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="exit with an error when the median cold start is slower than this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}", SEED_DB="0")
+        subprocess.run([sys.executable, "-m", "migrations", "upgrade"], env=env, check=True, capture_output=True)
+        runs = [probe(env) for _ in range(args.repeat)]
+
+    imports = statistics.median(run["import"] for run in runs)
+    startups = statistics.median(run["startup"] for run in runs)
+    print(f"import  {imports * 1000:>8.1f} ms")
+    print(f"startup {startups * 1000:>8.1f} ms")
+    print(f"total   {(imports + startups) * 1000:>8.1f} ms")
+    if args.max_seconds is not None and imports + startups > args.max_seconds:
+        sys.exit(f"cold start {imports + startups:.2f}s is over the {args.max_seconds:.2f}s limit")
+
+
+if __name__ == "__main__":
+    main()
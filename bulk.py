@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+from collections import deque
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import response_cache
+
+# rows are validated and inserted in chunks of this size, all inside one transaction
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 5000))
+
+JSON_TYPES = ("application/json",)
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+CSV_TYPES = ("text/csv",)
+
+
+def _decode(line: bytes) -> str:
+    try:
+        return line.decode()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body is not valid UTF-8")
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[str]:
+    # lines keep their line break, a quoted CSV field may span several of them
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode(line + b"\n")
+    if buffer:
+        yield _decode(buffer)
+
+
+class _PendingLines:
+    # the iterator a csv.reader reads from, it runs dry until the next complete record is pushed
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+async def read_records(request: Request) -> AsyncIterator[Tuple[int, object]]:
+    # yields (row number, record) pairs, a record that can't be parsed is yielded as an exception
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    if content_type in JSON_TYPES:
+        try:
+            records = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body is not valid JSON")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array")
+        for row, record in enumerate(records):
+            yield row, record
+    elif content_type in NDJSON_TYPES:
+        row = 0
+        async for line in _iter_lines(request):
+            if not line.strip():
+                continue
+            try:
+                yield row, json.loads(line)
+            except ValueError as exc:
+                yield row, exc
+            row += 1
+    elif content_type in CSV_TYPES:
+        header = None
+        row = 0
+        pending = _PendingLines()
+        reader = csv.reader(pending)
+        record = ""
+        async for line in _iter_lines(request):
+            # a record ends at a line break outside quotes, escaped quotes come in pairs
+            record += line
+            if record.count('"') % 2:
+                continue
+            pending.lines.append(record)
+            record = ""
+            while pending.lines:
+                try:
+                    values = next(reader)
+                except csv.Error as exc:
+                    yield row, exc
+                    row += 1
+                    continue
+                if not "".join(values).strip():
+                    continue
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                # empty cells mean "not set" so that optional fields fall back to their defaults
+                yield row, {name: value for name, value in zip(header, values) if value != ""}
+                row += 1
+        if record:
+            yield row, ValueError("unterminated quoted field")
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {content_type}")
+
+
+async def _chunks(records: AsyncIterator, size: int) -> AsyncIterator[list]:
+    chunk = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def ingest(db: AsyncSession, records: AsyncIterator, schema, insert_many, table: str) -> dict:
+    results: List[dict] = []
+    inserted = 0
+    async for chunk in _chunks(records, BULK_CHUNK_SIZE):
+        valid = []
+        for row, record in chunk:
+            if isinstance(record, Exception):
+                results.append({"row": row, "error": f"Invalid record: {record}"})
+                continue
+            try:
+                valid.append((row, schema.parse_obj(record)))
+            except ValidationError as exc:
+                results.append({"row": row, "error": exc.errors()})
+
+        known_ids = await crud.get_existing_employee_ids(db, {item.employee_id for _, item in valid})
+        to_insert = []
+        for row, item in valid:
+            if item.employee_id in known_ids:
+                to_insert.append((row, item))
+            else:
+                results.append({"row": row, "error": "Employee not found"})
+
+        if to_insert:
+            ids = await insert_many(db, [item for _, item in to_insert])
+            results.extend({"row": row, "id": new_id} for (row, _), new_id in zip(to_insert, ids))
+            inserted += len(ids)
+
+    await db.commit()
+    await response_cache.cache.invalidate(table)
+    results.sort(key=lambda result: result["row"])
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
@@ -1,8 +1,20 @@
+import asyncio
+import hashlib
+import re
+import secrets
+from datetime import datetime
+from typing import Iterable, List, Union
+
 from passlib.context import CryptContext
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, desc, func, insert, select, true, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
+import hashing
 import models
+import principals
+import response_cache
 import schemas
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -16,160 +28,490 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_own_salary(db: Session, employee_id: int):
-    return db.query(models.Salary).filter_by(employee_id=employee_id).order_by(desc(models.Salary.id)).first()
+async def get_password_hash_async(password):
+    return await hashing.pool.run(get_password_hash, password)
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await hashing.pool.run(verify_password, plain_password, hashed_password)
+
+
+async def get_own_salary(db: AsyncSession, employee_id: int):
+    return await db.scalar(select(models.Salary).filter_by(employee_id=employee_id)
+                           .order_by(desc(models.Salary.id)).limit(1))
+
+
+async def get_own_promotion(db: AsyncSession, employee_id: int):
+    return await db.scalar(select(models.Promotion).filter_by(employee_id=employee_id)
+                           .order_by(desc(models.Promotion.id)).limit(1))
+
+
+# returns (employee, salary, promotion) rows: the latest promotion and up to history_size
+# latest salaries, newest first, all in one statement
+async def get_own_compensation(db: AsyncSession, employee_id: int, history_size: int = 1):
+    salaries = select(models.Salary).filter_by(employee_id=employee_id) \
+        .order_by(desc(models.Salary.id)).limit(max(history_size, 1)).subquery()
+    promotions = select(models.Promotion).filter_by(employee_id=employee_id) \
+        .order_by(desc(models.Promotion.id)).limit(1).subquery()
+    salary, promotion = aliased(models.Salary, salaries), aliased(models.Promotion, promotions)
+    query = select(models.Employee, salary, promotion).select_from(models.Employee) \
+        .outerjoin(salary, true()).outerjoin(promotion, true()) \
+        .where(models.Employee.id == employee_id).order_by(desc(salary.id))
+    return (await db.execute(query)).all()
+
+
+# VERSIONS
+# cheap lookups used to answer conditional GETs without loading whole rows
+async def get_row_version(db: AsyncSession, model, row_id: int):
+    return await db.scalar(select(model.version).where(model.id == row_id))
+
+
+async def get_own_latest_version(db: AsyncSession, model, employee_id: int):
+    return (await db.execute(select(model.id, model.version).filter_by(employee_id=employee_id)
+                             .order_by(desc(model.id)).limit(1))).first()
+
+
+async def get_table_version(db: AsyncSession, table: str) -> int:
+    return await db.scalar(select(models.TableVersion.version).filter_by(name=table)) or 0
+
+
+# PROJECTIONS
+# plain column tuples for the list endpoints, no ORM instances or identity map
+def select_rows(model, fields: List[str], skip: int = 0, limit: int = 100, after_id: Union[int, None] = None,
+                where: Iterable = ()):
+    query = select(*(getattr(model, field) for field in fields)).where(*where).order_by(model.id).limit(limit)
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    else:
+        query = query.offset(skip)
+    return query
+
+
+async def get_rows(db: AsyncSession, model, fields: List[str], skip: int = 0, limit: int = 100,
+                   after_id: Union[int, None] = None, where: Iterable = ()):
+    return (await db.execute(select_rows(model, fields, skip, limit, after_id, where))).all()
+
+
+# FILTERS
+# each filter has a matching index, see the indexes on Salary and Promotion
+def received_filters(model, employee_id: Union[int, None] = None, received_from: Union[datetime, None] = None,
+                     received_to: Union[datetime, None] = None, is_received: Union[bool, None] = None) -> list:
+    where = []
+    if employee_id is not None:
+        where.append(model.employee_id == employee_id)
+    if received_from is not None:
+        where.append(model.received_at >= received_from)
+    if received_to is not None:
+        where.append(model.received_at < received_to)
+    if is_received is not None:
+        where.append(model.is_received == is_received)
+    return where
+
+
+def total_filters(total_min: Union[float, None] = None, total_max: Union[float, None] = None) -> list:
+    where = []
+    if total_min is not None:
+        where.append(models.Salary.total >= total_min)
+    if total_max is not None:
+        where.append(models.Salary.total <= total_max)
+    return where
+
+
+def employee_search_filters(search: Union[str, None] = None) -> list:
+    # every word must match the start of a word in the username, first or last name
+    words = re.findall(r"\w+", search or "")
+    if not words:
+        return []
+    match = " ".join(f'"{word}"*' for word in words)
+    return [models.Employee.id.in_(select(models.employee_fts.c.rowid)
+                                   .where(models.employee_fts.c.employee_fts.match(match)))]
+
+
+# WRITES
+# updates and deletes are single statements; the affected row comes back through RETURNING,
+# so a missing row is detected without a separate SELECT
+async def _update_returning(db: AsyncSession, model, row_id: int, values: dict):
+    query = update(model).where(model.id == row_id).values(**values, version=model.version + 1) \
+        .returning(model).execution_options(synchronize_session=False)
+    row = (await db.execute(query)).scalar_one_or_none()
+    await db.commit()
+    return row
+
+
+async def _delete_returning(db: AsyncSession, model, row_id: int, *columns):
+    query = delete(model).where(model.id == row_id).returning(*(columns or (model.id,)))
+    row = (await db.execute(query)).one_or_none()
+    await db.commit()
+    return row
+
+
+async def get_employee_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(models.Employee).filter_by(username=username).limit(1))
 
 
-def get_own_promotion(db: Session, employee_id: int):
-    return db.query(models.Promotion).filter_by(employee_id=employee_id).order_by(desc(models.Promotion.id)).first()
+async def get_token_versions(db: AsyncSession):
+    result = await db.execute(select(models.Employee.id, models.Employee.token_version))
+    return dict(result.all())
 
 
-def get_employee_by_username(db: Session, username: str):
-    return db.query(models.Employee).filter_by(username=username).first()
+async def get_token_version(db: AsyncSession, employee_id: int):
+    return await db.scalar(select(models.Employee.token_version).where(models.Employee.id == employee_id))
 
 
-def create_employee(db: Session, employee: schemas.EmployeeCreate):
-    hashed_password = get_password_hash(employee.password)
+async def create_employee(db: AsyncSession, employee: schemas.EmployeeCreate):
+    hashed_password = await get_password_hash_async(employee.password)
     employee = models.Employee(firstname=employee.firstname, lastname=employee.lastname,
                                username=employee.username, password=hashed_password,
                                is_admin=employee.is_admin)
     db.add(employee)
-    db.commit()
-    db.refresh(employee)
+    await db.commit()
+    await db.refresh(employee)
+    await response_cache.cache.invalidate("employee")
+    principals.token_versions.set(employee.id, employee.token_version)
     return employee
 
 
-def get_employee(db: Session, user_id: int):
-    return db.query(models.Employee).filter_by(id=user_id).first()
+async def get_existing_employee_ids(db: AsyncSession, employee_ids: Iterable[int]):
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return set()
+    return set(await db.scalars(select(models.Employee.id).where(models.Employee.id.in_(employee_ids))))
 
 
-def get_employees(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Employee).offset(skip).limit(limit).all()
+async def get_employee(db: AsyncSession, user_id: int):
+    return await db.get(models.Employee, user_id)
 
 
-def update_employee(db: Session, employee_id: int, employee: schemas.EmployeeCreate):
-    db_employee = db.query(models.Employee).filter_by(id=employee_id).first()
-    if not db_employee:
-        return None
-    if employee.firstname:
-        db_employee.firstname = employee.firstname
-    if employee.lastname:
-        db_employee.lastname = employee.lastname
-    if employee.username:
-        db_employee.username = employee.username
-    if employee.password:
-        hashed_password = employee.password
-        db_employee.password = hashed_password
+async def update_employee(db: AsyncSession, employee_id: int, employee: schemas.EmployeeCreate):
+    values = {field: value for field, value in employee.dict().items() if value}
     if employee.is_admin is not None:
-        db_employee.is_admin = employee.is_admin
-    db.commit()
-    db.refresh(db_employee)
+        values["is_admin"] = employee.is_admin
+    return await _write_employee(db, employee_id, values)
+
+
+async def patch_employee(db: AsyncSession, employee_id: int, employee: schemas.EmployeeUpdate):
+    return await _write_employee(db, employee_id, employee.dict(exclude_unset=True, exclude_none=True))
+
+
+async def _write_employee(db: AsyncSession, employee_id: int, values: dict):
+    if "password" in values:
+        values["password"] = await get_password_hash_async(values["password"])
+    # a new password, username or role revokes outstanding access and refresh tokens, a name fix doesn't
+    if values.keys() & {"password", "username", "is_admin"}:
+        values = {**values, "token_version": models.Employee.token_version + 1}
+    db_employee = await _update_returning(db, models.Employee, employee_id, values)
+    if db_employee is None:
+        return None
+    await response_cache.cache.invalidate("employee", employee_id)
+    if "username" in values:
+        # RETURNING only has the new username, the entry cached under the old one can't be found by key
+        principals.cache.clear()
+    principals.cache.delete(db_employee.username)
+    principals.token_versions.set(db_employee.id, db_employee.token_version)
     return db_employee
 
 
-def delete_employee(db: Session, employee_id: int):
-    db_employee = db.query(models.Employee).filter_by(id=employee_id).first()
-    if not db_employee:
+async def delete_employee(db: AsyncSession, employee_id: int):
+    # refresh tokens reference the employee, they go first
+    await db.execute(delete(models.RefreshToken).where(models.RefreshToken.employee_id == employee_id))
+    deleted = await _delete_returning(db, models.Employee, employee_id, models.Employee.username)
+    if deleted is None:
         return False
-    db.delete(db_employee)
-    db.commit()
+    await response_cache.cache.invalidate("employee", employee_id)
+    principals.cache.delete(deleted.username)
+    principals.token_versions.discard(employee_id)
     return True
 
 
+# REFRESH TOKENS
+# looked up by sha256 of the token, no bcrypt involved; a token is deleted when it is exchanged,
+# so each one can be used once
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def _insert_refresh_token(db: AsyncSession, employee_id: int, token_version: int, device: str,
+                                expires_at: datetime) -> str:
+    token = secrets.token_urlsafe(32)
+    await db.execute(insert(models.RefreshToken).values(
+        token_hash=hash_refresh_token(token), employee_id=employee_id, token_version=token_version,
+        device=device, created_at=datetime.utcnow(), expires_at=expires_at))
+    return token
+
+
+async def create_refresh_token(db: AsyncSession, employee: models.Employee, device: str,
+                               expires_at: datetime) -> str:
+    token = await _insert_refresh_token(db, employee.id, employee.token_version, device, expires_at)
+    await db.commit()
+    return token
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str, expires_at: datetime):
+    # returns (employee, new token), or None when the token is unknown, expired or revoked
+    query = delete(models.RefreshToken).where(models.RefreshToken.token_hash == hash_refresh_token(token)) \
+        .returning(models.RefreshToken.employee_id, models.RefreshToken.token_version,
+                   models.RefreshToken.device, models.RefreshToken.expires_at)
+    row = (await db.execute(query)).one_or_none()
+    employee = None
+    if row is not None and row.expires_at > datetime.utcnow():
+        employee = await db.get(models.Employee, row.employee_id)
+    if employee is None or employee.token_version != row.token_version:
+        await db.commit()
+        return None
+    new_token = await _insert_refresh_token(db, employee.id, employee.token_version, row.device, expires_at)
+    await db.commit()
+    return employee, new_token
+
+
+async def revoke_refresh_token(db: AsyncSession, token: str) -> bool:
+    query = delete(models.RefreshToken).where(models.RefreshToken.token_hash == hash_refresh_token(token))
+    result = await db.execute(query)
+    await db.commit()
+    return result.rowcount > 0
+
+
+async def revoke_refresh_tokens(db: AsyncSession, employee_id: int, device: Union[str, None] = None) -> int:
+    query = delete(models.RefreshToken).where(models.RefreshToken.employee_id == employee_id)
+    if device is not None:
+        query = query.where(models.RefreshToken.device == device)
+    result = await db.execute(query)
+    await db.commit()
+    return result.rowcount
+
+
+async def delete_expired_refresh_tokens(db: AsyncSession, now: datetime, batch_size: int = 1000) -> int:
+    # small batches keep the write lock short when a lot of tokens expire at once
+    deleted = 0
+    while True:
+        expired = select(models.RefreshToken.id).where(models.RefreshToken.expires_at <= now).limit(batch_size)
+        result = await db.execute(delete(models.RefreshToken).where(models.RefreshToken.id.in_(expired))
+                                  .execution_options(synchronize_session=False))
+        await db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
 # SALARIES
 # CREATE
-def create_salary(db: Session, salary: schemas.SalaryCreate):
+async def create_salary(db: AsyncSession, salary: schemas.SalaryCreate):
     salary_db = models.Salary(employee_id=salary.employee_id,
                               total=salary.total,
                               received_at=salary.received_at,
                               is_received=salary.is_received)
     db.add(salary_db)
-    db.commit()
-    db.refresh(salary_db)
+    await db.commit()
+    await db.refresh(salary_db)
+    await response_cache.cache.invalidate("salary")
     return salary_db
 
 
-# READ (ONE)
-def get_salary(db: Session, salary_id: int):
-    return db.query(models.Salary).filter_by(id=salary_id).first()
+# CREATE (MANY)
+# inserts with a single executemany and leaves committing to the caller.
+# RETURNING order isn't guaranteed, sort_by_parameter_order lines the ids up with the input rows
+async def create_salaries(db: AsyncSession, salaries: List[schemas.SalaryCreate]):
+    result = await db.execute(insert(models.Salary).returning(models.Salary.id, sort_by_parameter_order=True),
+                              [salary.dict() for salary in salaries])
+    return list(result.scalars())
 
 
-# READ (MANY)
-def get_salaries(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Salary).offset(skip).limit(limit).all()
+# READ (ONE)
+async def get_salary(db: AsyncSession, salary_id: int):
+    return await db.get(models.Salary, salary_id)
+
+
+# HISTORY
+# newest first by (received_at, id): a range seek on ix_salary_employee_id_received_at, whose entries end
+# with the rowid, so the order and the keyset condition are resolved from the index. as_of is an inclusive
+# upper bound, with limit=1 it gives the salary in effect on that date
+def select_salary_history(employee_id: int, received_from: Union[datetime, None] = None,
+                          received_to: Union[datetime, None] = None, as_of: Union[datetime, None] = None,
+                          after: Union[tuple, None] = None, limit: int = 24):
+    query = select(models.Salary).where(
+        models.Salary.employee_id == employee_id, models.Salary.received_at.isnot(None),
+        *received_filters(models.Salary, received_from=received_from, received_to=received_to))
+    if as_of is not None:
+        query = query.where(models.Salary.received_at <= as_of)
+    if after is not None:
+        query = query.where(tuple_(models.Salary.received_at, models.Salary.id) < after)
+    return query.order_by(desc(models.Salary.received_at), desc(models.Salary.id)).limit(limit)
+
+
+async def get_salary_history(db: AsyncSession, employee_id: int, received_from: Union[datetime, None] = None,
+                             received_to: Union[datetime, None] = None, as_of: Union[datetime, None] = None,
+                             after: Union[tuple, None] = None, limit: int = 24):
+    return (await db.scalars(select_salary_history(employee_id, received_from, received_to, as_of, after,
+                                                   limit))).all()
+
+
+# EXPORT
+def select_salaries_for_export(employee_id: Union[int, None] = None, received_from: Union[datetime, None] = None,
+                               received_to: Union[datetime, None] = None):
+    query = select(models.Salary.id, models.Salary.employee_id, models.Salary.total, models.Salary.created_at,
+                   models.Salary.received_at, models.Salary.is_received).order_by(models.Salary.id)
+    return query.where(*received_filters(models.Salary, employee_id, received_from, received_to))
 
 
 # UPDATE
-def update_salary(db: Session, salary_id: int, salary: schemas.SalaryCreate):
-    salary_db = db.query(models.Salary).filter_by(id=salary_id).first()
-    if not salary_db:
-        return None
-    if salary.employee_id:
-        salary_db.employee_id = salary.employee_id
-    if salary.total:
-        salary_db.total = salary.total
-    if salary.received_at:
-        salary_db.received_at = salary.received_at
+async def update_salary(db: AsyncSession, salary_id: int, salary: schemas.SalaryCreate):
+    values = {field: value for field, value in salary.dict().items() if value}
     if salary.is_received is not None:
-        salary_db.is_received = salary.is_received
-    db.commit()
-    db.refresh(salary_db)
+        values["is_received"] = salary.is_received
+    return await _write_salary(db, salary_id, values)
+
+
+async def patch_salary(db: AsyncSession, salary_id: int, salary: schemas.SalaryUpdate):
+    return await _write_salary(db, salary_id, salary.dict(exclude_unset=True, exclude_none=True))
+
+
+async def _write_salary(db: AsyncSession, salary_id: int, values: dict):
+    salary_db = await _update_returning(db, models.Salary, salary_id, values)
+    if salary_db is not None:
+        await response_cache.cache.invalidate("salary", salary_id)
     return salary_db
 
 
 # DELETE
-def delete_salary(db: Session, salary_id: int):
-    salary_db = db.query(models.Salary).filter_by(id=salary_id).first()
-    if not salary_db:
+async def delete_salary(db: AsyncSession, salary_id: int):
+    if await _delete_returning(db, models.Salary, salary_id) is None:
         return False
-    db.delete(salary_db)
-    db.commit()
+    await response_cache.cache.invalidate("salary", salary_id)
     return True
 
 
 # PROMOTIONS
 # CREATE
-def create_promotion(db: Session, promotion: schemas.PromotionCreate):
+async def create_promotion(db: AsyncSession, promotion: schemas.PromotionCreate):
     promotion_db = models.Promotion(employee_id=promotion.employee_id,
                                     received_at=promotion.received_at,
                                     is_received=promotion.is_received)
     db.add(promotion_db)
-    db.commit()
-    db.refresh(promotion_db)
+    await db.commit()
+    await db.refresh(promotion_db)
+    await response_cache.cache.invalidate("promotion")
     return promotion_db
 
 
+# CREATE (MANY)
+async def create_promotions(db: AsyncSession, promotions: List[schemas.PromotionCreate]):
+    result = await db.execute(insert(models.Promotion).returning(models.Promotion.id, sort_by_parameter_order=True),
+                              [promotion.dict() for promotion in promotions])
+    return list(result.scalars())
+
+
 # READ (ONE)
-def get_promotion(db: Session, promotion_id: int):
-    return db.query(models.Promotion).filter_by(id=promotion_id).first()
+async def get_promotion(db: AsyncSession, promotion_id: int):
+    return await db.get(models.Promotion, promotion_id)
 
 
-# READ (MANY)
-def get_promotions(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Promotion).offset(skip).limit(limit).all()
+# EXPORT
+def select_promotions_for_export(employee_id: Union[int, None] = None, received_from: Union[datetime, None] = None,
+                                 received_to: Union[datetime, None] = None):
+    query = select(models.Promotion.id, models.Promotion.employee_id, models.Promotion.created_at,
+                   models.Promotion.received_at, models.Promotion.is_received).order_by(models.Promotion.id)
+    return query.where(*received_filters(models.Promotion, employee_id, received_from, received_to))
 
 
 # UPDATE
-def update_promotion(db: Session, promotion_id: int, promotion: schemas.PromotionCreate):
-    promotion_db = db.query(models.Promotion).filter_by(id=promotion_id).first()
-    if not promotion_db:
-        return None
-    if promotion.employee_id:
-        promotion_db.employee_id = promotion.employee_id
-    if promotion.received_at:
-        promotion_db.received_at = promotion.received_at
+async def update_promotion(db: AsyncSession, promotion_id: int, promotion: schemas.PromotionCreate):
+    values = {field: value for field, value in promotion.dict().items() if value}
     if promotion.is_received is not None:
-        promotion_db.is_received = promotion.is_received
-    db.commit()
-    db.refresh(promotion_db)
+        values["is_received"] = promotion.is_received
+    return await _write_promotion(db, promotion_id, values)
+
+
+async def patch_promotion(db: AsyncSession, promotion_id: int, promotion: schemas.PromotionUpdate):
+    return await _write_promotion(db, promotion_id, promotion.dict(exclude_unset=True, exclude_none=True))
+
+
+async def _write_promotion(db: AsyncSession, promotion_id: int, values: dict):
+    promotion_db = await _update_returning(db, models.Promotion, promotion_id, values)
+    if promotion_db is not None:
+        await response_cache.cache.invalidate("promotion", promotion_id)
     return promotion_db
 
 
 # DELETE
-def delete_promotion(db: Session, promotion_id: int):
-    promotion_db = db.query(models.Promotion).filter_by(id=promotion_id).first()
-    if not promotion_db:
+async def delete_promotion(db: AsyncSession, promotion_id: int):
+    if await _delete_returning(db, models.Promotion, promotion_id) is None:
         return False
-    db.delete(promotion_db)
-    db.commit()
+    await response_cache.cache.invalidate("promotion", promotion_id)
     return True
+
+
+# SETTLEMENT
+# marks salaries and promotions received once received_at has passed. Every batch is a short
+# transaction of its own, so the SQLite write lock is released between batches
+async def settle_due(db: AsyncSession, model, now: datetime, batch_size: int = 500, pause: float = 0) -> int:
+    settled = 0
+    while True:
+        due = select(model.id).where(model.is_received == False, model.received_at <= now).limit(batch_size)
+        query = update(model).where(model.id.in_(due)).values(is_received=True, version=model.version + 1) \
+            .returning(model.id).execution_options(synchronize_session=False)
+        row_ids = (await db.scalars(query)).all()
+        await db.commit()
+        await response_cache.cache.invalidate_rows(model.__tablename__, row_ids)
+        settled += len(row_ids)
+        if len(row_ids) < batch_size:
+            return settled
+        # lets writers waiting for the lock go first
+        await asyncio.sleep(pause)
+
+
+# LEASES
+async def acquire_lease(db: AsyncSession, name: str, owner: str, now: datetime, expires_at: datetime) -> bool:
+    # takes the lease if nobody holds it, it expired or `owner` already holds it; a single statement,
+    # so two workers can't both get it
+    query = sqlite_insert(models.TaskLease).values(name=name, owner=owner, expires_at=expires_at)
+    query = query.on_conflict_do_update(
+        index_elements=[models.TaskLease.name], set_={"owner": owner, "expires_at": expires_at},
+        where=(models.TaskLease.owner == owner) | (models.TaskLease.expires_at < now),
+    ).returning(models.TaskLease.name)
+    acquired = (await db.execute(query)).first() is not None
+    await db.commit()
+    return acquired
+
+
+# REPORTS
+# payroll reports read payroll_summary, which the salary triggers keep up to date
+def _select_payroll_summary(group_by, employee_id: Union[int, None], month_from: Union[str, None],
+                            month_to: Union[str, None]):
+    summary = models.PayrollSummary
+    query = select(group_by, func.sum(summary.total).label("total"), func.sum(summary.salaries).label("salaries")) \
+        .group_by(group_by).order_by(group_by)
+    if employee_id is not None:
+        query = query.where(summary.employee_id == employee_id)
+    if month_from is not None:
+        query = query.where(summary.month >= month_from)
+    if month_to is not None:
+        query = query.where(summary.month <= month_to)
+    return query
+
+
+async def get_payroll_by_employee(db: AsyncSession, employee_id: Union[int, None] = None,
+                                  month_from: Union[str, None] = None, month_to: Union[str, None] = None):
+    query = _select_payroll_summary(models.PayrollSummary.employee_id, employee_id, month_from, month_to)
+    return (await db.execute(query)).all()
+
+
+async def get_payroll_by_month(db: AsyncSession, employee_id: Union[int, None] = None,
+                               month_from: Union[str, None] = None, month_to: Union[str, None] = None):
+    query = _select_payroll_summary(models.PayrollSummary.month, employee_id, month_from, month_to)
+    return (await db.execute(query)).all()
+
+
+async def get_payroll_by_status(db: AsyncSession, employee_id: Union[int, None] = None,
+                                month_from: Union[str, None] = None, month_to: Union[str, None] = None):
+    query = _select_payroll_summary(models.PayrollSummary.is_received, employee_id, month_from, month_to)
+    return (await db.execute(query)).all()
+
+
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m", "year": "%Y"}
+
+
+async def get_upcoming_promotions(db: AsyncSession, period: str = "month", now: Union[datetime, None] = None):
+    period_column = func.strftime(PERIOD_FORMATS[period], models.Promotion.received_at)
+    query = select(period_column.label("period"), func.count().label("promotions")) \
+        .where(models.Promotion.is_received == False, models.Promotion.received_at >= (now or datetime.now())) \
+        .group_by(period_column).order_by(period_column)
+    return (await db.execute(query)).all()
@@ -0,0 +1,34 @@
+import hashlib
+
+from fastapi import Request, Response
+
+
+# rows carry a version column bumped on every update, tables a counter in table_version
+def row_etag(table: str, row_id: int, version: int) -> str:
+    return f'"{table}-{row_id}-{version}"'
+
+
+def collection_etag(table: str, version: int, request: Request) -> str:
+    query = hashlib.sha1(str(request.query_params).encode()).hexdigest()[:16]
+    return f'"{table}-v{version}-{query}"'
+
+
+def is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    # If-None-Match uses the weak comparison: W/"x" matches "x", proxies weaken tags they re-encode
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or _opaque_tag(etag) in (_opaque_tag(tag) for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
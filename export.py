@@ -0,0 +1,43 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# rows are fetched from a server-side cursor and written out in batches of this size
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+
+def _encode_ndjson(columns, rows) -> str:
+    return "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows)
+
+
+def _encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+    return buffer.getvalue()
+
+
+async def stream_rows(db: AsyncSession, query, fmt: str):
+    # streams from the session of the request, the route's dependencies are closed after the response is sent
+    columns = [column.name for column in query.selected_columns]
+    if fmt == "csv":
+        yield _encode_csv([columns])
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for rows in result.partitions():
+        yield _encode_csv(rows) if fmt == "csv" else _encode_ndjson(columns, rows)
@@ -1,29 +1,40 @@
-from datetime import datetime, timedelta
+import itertools
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable
 
+import sqlalchemy as sa
 from sqlalchemy.orm import Session
 
 import crud
-from models import Employee, Salary, Promotion
+import hashing
+from models import (Employee, Salary, Promotion, EMPLOYEE_FTS_DDL, EMPLOYEE_FTS_REBUILD, PAYROLL_SUMMARY_BACKFILL,
+                    PAYROLL_SUMMARY_TRIGGERS, TABLE_VERSION_TRIGGERS, VERSIONED_TABLES)
 
 
 def fill_db(db: Session) -> bool:
+    passwords = hashing.pool.map(crud.get_password_hash, ["password1", "password2", "password3", "password4"])
     first_employee = Employee(username="username1",
-                              password=crud.get_password_hash("password1"),
+                              password=passwords[0],
                               firstname="Elena",
                               lastname="Hoffman",
                               is_admin=True)
     second_employee = Employee(username="username2",
-                               password=crud.get_password_hash("password2"),
+                               password=passwords[1],
                                firstname="Ivan",
                                lastname="Petrov",
                                is_admin=False)
     third_employee = Employee(username="username3",
-                              password=crud.get_password_hash("password3"),
+                              password=passwords[2],
                               firstname="Sergey",
                               lastname="Pushkin",
                               is_admin=False)
     fourth_employee = Employee(username="username4",
-                               password=crud.get_password_hash("password4"),
+                               password=passwords[3],
                                firstname="Anastasia",
                                lastname="Waltz",
                                is_admin=False)
@@ -58,3 +69,171 @@ def fill_db(db: Session) -> bool:
         return False
     db.close()
     return True
+
+
+# SYNTHETIC DATA
+FIRSTNAMES = ["Elena", "Ivan", "Sergey", "Anastasia", "Olga", "Dmitry", "Maria", "Alexey", "Natalia", "Pavel",
+              "Irina", "Andrey", "Tatiana", "Mikhail", "Ekaterina", "Nikolay"]
+LASTNAMES = ["Hoffman", "Petrov", "Pushkin", "Waltz", "Ivanov", "Smirnov", "Kuznetsov", "Popov", "Sokolov",
+             "Lebedev", "Kozlov", "Novikov", "Morozov", "Volkov", "Solovyov", "Vasiliev"]
+
+# triggers that maintain payroll_summary and table_version row by row; a bulk load drops them
+# and rebuilds the derived tables once at the end
+BULK_LOAD_TRIGGERS = ["payroll_summary_salary_insert", "employee_fts_insert"] + \
+    [f"table_version_{table}_insert" for table in VERSIONED_TABLES]
+BULK_LOAD_INDEXES = list(Salary.__table__.indexes) + list(Promotion.__table__.indexes)
+BULK_LOAD_PRAGMAS = ["journal_mode=WAL", "synchronous=OFF", "cache_size=-262144", "temp_store=MEMORY"]
+
+
+@dataclass
+class Distribution:
+    employees: int = 100_000
+    # salaries are paid monthly, so this is also how many months of history each employee has
+    salaries_per_employee: int = 24
+    salary_mean: float = 2000
+    salary_sigma: float = 0.4
+    admin_rate: float = 0.001
+    promotion_rate: float = 0.3
+    # share of promotions that are still ahead, spread over the next promotion_horizon_days
+    upcoming_promotion_rate: float = 0.2
+    promotion_horizon_days: int = 90
+
+
+EMPLOYEE_COLUMNS = ["id", "username", "password", "firstname", "lastname", "is_admin", "token_version", "version"]
+SALARY_COLUMNS = ["employee_id", "total", "created_at", "received_at", "is_received", "version"]
+PROMOTION_COLUMNS = ["employee_id", "created_at", "received_at", "is_received", "version"]
+
+
+def _timestamp(value: datetime) -> str:
+    # the format SQLAlchemy stores DateTime columns in on SQLite
+    return value.isoformat(sep=" ", timespec="microseconds")
+
+
+def _employee_rows(rng: random.Random, distribution: Distribution, first_id: int, password: str):
+    for employee_id in range(first_id, first_id + distribution.employees):
+        yield (employee_id, f"employee{employee_id}", password, rng.choice(FIRSTNAMES), rng.choice(LASTNAMES),
+               rng.random() < distribution.admin_rate, 0, 1)
+
+
+def _salary_rows(rng: random.Random, distribution: Distribution, first_id: int, today: datetime):
+    months = distribution.salaries_per_employee
+    # received_at is always a whole number of days before today, so timestamps are formatted once per day
+    days = [_timestamp(today - timedelta(days=day)) for day in range(30 * months + 30)]
+    future_days = [_timestamp(today + timedelta(days=day)) for day in range(28)]
+    for employee_id in range(first_id, first_id + distribution.employees):
+        base = rng.lognormvariate(math.log(distribution.salary_mean), distribution.salary_sigma)
+        for month in range(months):
+            # the newest salary may be due in the coming weeks and not yet paid
+            day = 30 * (months - month - 1) - int(rng.random() * 28)
+            received_at = days[day] if day >= 0 else future_days[-day]
+            yield (employee_id, round(base * (1 + 0.005 * month), 2), days[day + 30], received_at, day >= 0, 1)
+
+
+def _promotion_rows(rng: random.Random, distribution: Distribution, first_id: int, today: datetime):
+    for employee_id in range(first_id, first_id + distribution.employees):
+        if rng.random() >= distribution.promotion_rate:
+            continue
+        if rng.random() < distribution.upcoming_promotion_rate:
+            received_at = today + timedelta(days=rng.randint(1, distribution.promotion_horizon_days))
+        else:
+            received_at = today - timedelta(days=rng.randint(0, 30 * distribution.salaries_per_employee))
+        yield (employee_id, _timestamp(received_at - timedelta(days=30)), _timestamp(received_at),
+               received_at <= today, 1)
+
+
+def _insert_batches(connection, table: str, columns: list, rows, batch_size: int,
+                    progress: Callable[[str, int], None]) -> int:
+    # plain driver executemany, SQLAlchemy's per-row parameter processing costs more than the insert itself
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    inserted = 0
+    while batch := list(itertools.islice(rows, batch_size)):
+        connection.exec_driver_sql(statement, batch)
+        inserted += len(batch)
+        progress(table, inserted)
+    return inserted
+
+
+def generate(engine: sa.Engine, distribution: Distribution, seed: int = 0, today: datetime = None,
+             password: str = "password", batch_size: int = 50_000,
+             progress: Callable[[str, int], None] = lambda table, rows: None) -> dict:
+    # the same seed and date always produce the same rows; every synthetic employee shares one password hash
+    rng = random.Random(seed)
+    today = today or datetime.combine(date.today(), datetime.min.time())
+    password_hash = crud.get_password_hash(password)
+
+    with engine.begin() as connection:
+        for trigger in BULK_LOAD_TRIGGERS:
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        # building the indexes once after the load is faster than updating them row by row
+        for index in BULK_LOAD_INDEXES:
+            index.drop(connection, checkfirst=True)
+        # explicit ids bypass AUTOINCREMENT, so they start after the highest id ever handed out, deleted ones
+        # included; SQLite moves sqlite_sequence past the inserted ids by itself
+        first_id = connection.exec_driver_sql(
+            "SELECT MAX((SELECT COALESCE(MAX(id), 0) FROM employee), "
+            "(SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'employee'))").scalar() + 1
+        counts = {
+            "employee": _insert_batches(connection, "employee", EMPLOYEE_COLUMNS,
+                                        _employee_rows(rng, distribution, first_id, password_hash),
+                                        batch_size, progress),
+            "salary": _insert_batches(connection, "salary", SALARY_COLUMNS,
+                                      _salary_rows(rng, distribution, first_id, today), batch_size, progress),
+            "promotion": _insert_batches(connection, "promotion", PROMOTION_COLUMNS,
+                                         _promotion_rows(rng, distribution, first_id, today), batch_size, progress),
+        }
+        for index in BULK_LOAD_INDEXES:
+            index.create(connection, checkfirst=True)
+        for statement in PAYROLL_SUMMARY_BACKFILL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(EMPLOYEE_FTS_REBUILD)
+        for trigger in PAYROLL_SUMMARY_TRIGGERS + TABLE_VERSION_TRIGGERS + EMPLOYEE_FTS_DDL:
+            connection.exec_driver_sql(trigger)
+        for table in VERSIONED_TABLES:
+            connection.execute(sa.text("INSERT INTO table_version (name, version) VALUES (:name, 1) "
+                                       "ON CONFLICT (name) DO UPDATE SET version = version + 1"), {"name": table})
+    return counts
+
+
+def _print_progress(started: float):
+    def progress(table: str, rows: int):
+        elapsed = time.perf_counter() - started
+        print(f"\r{table:>10}: {rows:>12,} rows  {elapsed:>7.1f}s", end="", file=sys.stderr, flush=True)
+    return progress
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import migrations
+    import settings
+
+    defaults = Distribution()
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic employees, salaries and promotions")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--employees", type=int, default=defaults.employees)
+    parser.add_argument("--salaries-per-employee", type=int, default=defaults.salaries_per_employee)
+    parser.add_argument("--salary-mean", type=float, default=defaults.salary_mean)
+    parser.add_argument("--salary-sigma", type=float, default=defaults.salary_sigma)
+    parser.add_argument("--admin-rate", type=float, default=defaults.admin_rate)
+    parser.add_argument("--promotion-rate", type=float, default=defaults.promotion_rate)
+    parser.add_argument("--upcoming-promotion-rate", type=float, default=defaults.upcoming_promotion_rate)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--today", type=date.fromisoformat, default=date.today(),
+                        help="date the generated history ends at, fix it to get identical databases")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    engine = settings.create_engine(args.database_url, pragmas=BULK_LOAD_PRAGMAS)
+    migrations.upgrade(engine)
+    distribution = Distribution(employees=args.employees, salaries_per_employee=args.salaries_per_employee,
+                                salary_mean=args.salary_mean, salary_sigma=args.salary_sigma,
+                                admin_rate=args.admin_rate, promotion_rate=args.promotion_rate,
+                                upcoming_promotion_rate=args.upcoming_promotion_rate)
+    started = time.perf_counter()
+    counts = generate(engine, distribution, seed=args.seed, today=datetime.combine(args.today, datetime.min.time()),
+                      password=args.password, batch_size=args.batch_size, progress=_print_progress(started))
+    print(file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    print(", ".join(f"{rows:,} {table}" for table, rows in counts.items()) +
+          f" in {elapsed:.1f}s ({sum(counts.values()) / elapsed:,.0f} rows/s)")
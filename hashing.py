@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+# bcrypt is CPU bound, so hashing and verification run in a separate process pool
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# how many hash jobs may be queued or running before new ones are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", PASSWORD_HASH_WORKERS * 8))
+
+
+class HashingPoolBusy(Exception):
+    pass
+
+
+def _timed_call(fn, args):
+    started_at = time.monotonic()
+    result = fn(*args)
+    return result, started_at, time.monotonic()
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashingPoolBusy()
+        self.pending += 1
+        submitted_at = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, finished_at = await loop.run_in_executor(self._get_executor(),
+                                                                         _timed_call, fn, args)
+        finally:
+            self.pending -= 1
+        self._record(started_at - submitted_at, finished_at - started_at)
+        return result
+
+    def map(self, fn, items):
+        # blocking variant for scripts and startup code that run outside the event loop
+        return list(self._get_executor().map(fn, items))
+
+    def _record(self, wait_time: float, run_time: float):
+        self.completed += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+        self.run_time_total += run_time
+        metrics.password_hash_wait.observe(wait_time)
+        metrics.password_hash_duration.observe(run_time)
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queue_depth": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.wait_time_total / completed,
+            "max_wait_seconds": self.wait_time_max,
+            "avg_run_seconds": self.run_time_total / completed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pool = PasswordHashPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
@@ -1,13 +1,32 @@
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Union, List
 
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, Form, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import background
+import bulk
 import crud
+import etags
+import export
+import hashing
+import metrics
+import migrations
+import models
+import pagination
+import principals
+import profiling
+import projection
+import rate_limit
+import response_cache
 import schemas
 import settings
 
@@ -18,22 +37,94 @@ import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-app = FastAPI()
 
+async def sweep_refresh_tokens():
+    async with settings.get_sessionmaker()() as db:
+        return await crud.delete_expired_refresh_tokens(db, datetime.utcnow())
+
+
+async def refresh_token_versions():
+    # off the request path: one query over the whole employee table
+    read_at = time.monotonic()
+    async with settings.get_read_sessionmaker()() as db:
+        principals.token_versions.load(await crud.get_token_versions(db), read_at)
+
+
+async def settle_due():
+    now = datetime.now()
+    async with settings.get_sessionmaker()() as db:
+        # every worker runs the task, only the one holding the lease settles; it keeps the lease by renewing
+        # it each run and another worker takes over once it has missed a few
+        expires_at = now + timedelta(seconds=3 * settings.DUE_SETTLEMENT_INTERVAL_SECONDS)
+        if not await crud.acquire_lease(db, "due-settlement", background.WORKER_ID, now, expires_at):
+            return
+        for model in (models.Salary, models.Promotion):
+            settled = await crud.settle_due(db, model, now, settings.DUE_SETTLEMENT_BATCH_SIZE,
+                                            settings.DUE_SETTLEMENT_BATCH_PAUSE_SECONDS)
+            metrics.settled_rows.inc(model.__tablename__, amount=settled)
+
+
+periodic_tasks = [
+    background.PeriodicTask("refresh-token-sweeper", settings.REFRESH_TOKEN_SWEEP_SECONDS, sweep_refresh_tokens),
+    background.PeriodicTask("due-settlement", settings.DUE_SETTLEMENT_INTERVAL_SECONDS, settle_due),
+    background.PeriodicTask("token-versions",
+                            settings.TOKEN_VERSIONS_REFRESH_SECONDS if settings.JWT_CLAIMS_MODE else 0,
+                            refresh_token_versions),
+]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    response_cache.check_backend()
+    if settings.DB_MIGRATE_ON_STARTUP:
+        await run_in_threadpool(migrations.bootstrap, settings.get_engine(), settings.SEED_DB)
+    for task in periodic_tasks:
+        task.start()
+    yield
+    for task in periodic_tasks:
+        await task.stop()
+    hashing.pool.shutdown()
+    await settings.dispose_engines()
+
+
+app = FastAPI(lifespan=lifespan)
+if metrics.METRICS_ENABLED:
+    # must be set before the routes are declared
+    app.router.route_class = metrics.MetricsRoute
+if profiling.SQL_PROFILING:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+
+@app.exception_handler(hashing.HashingPoolBusy)
+async def hashing_pool_busy_handler(request: Request, exc: hashing.HashingPoolBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many password checks in progress, try again later"},
+        headers={"Retry-After": "1"},
+    )
 
-def get_db():
-    db = settings.SessionLocal()
-    try:
+
+async def get_db():
+    async with settings.get_sessionmaker()() as db:
         yield db
-    finally:
-        db.close()
 
 
-def authenticate_user(db, username: str, password: str):
-    user = crud.get_employee_by_username(db, username)
+# read-only routes and authentication; a query_only connection pool when DB_READ_ONLY_CONNECTIONS is enabled.
+# Otherwise it is get_db itself: FastAPI opens a dependency once per request, so authentication and the route
+# share one session instead of holding two connections of the same pool, which deadlocks under load
+if settings.DB_READ_ONLY_CONNECTIONS:
+    async def get_read_db():
+        async with settings.get_read_sessionmaker()() as db:
+            yield db
+else:
+    get_read_db = get_db
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await crud.get_employee_by_username(db, username)
     if not user:
         return False
-    if not crud.verify_password(password, user.password):
+    if not await crud.verify_password_async(password, user.password):
         return False
     return user
 
@@ -49,7 +140,31 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def refresh_token_expires_at() -> datetime:
+    return datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+
+
+def access_token_claims(user: models.Employee) -> dict:
+    claims = {"sub": user.username}
+    if settings.JWT_CLAIMS_MODE:
+        claims.update({"id": user.id, "adm": bool(user.is_admin), "ver": user.token_version})
+    return claims
+
+
+async def get_current_user_from_claims(payload: dict, db: AsyncSession):
+    version = principals.token_versions.get(payload["id"])
+    if version is None:
+        # not loaded yet, or created on another worker since the last reload
+        version = await crud.get_token_version(db, payload["id"])
+        if version is not None:
+            principals.token_versions.set(payload["id"], version)
+    if version != payload["ver"]:
+        return None
+    # names are not in the claims, endpoints that return them load the employee
+    return schemas.Employee(id=payload["id"], username=payload["sub"], is_admin=payload.get("adm"))
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -64,13 +179,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
 
-    user = crud.get_employee_by_username(db=db, username=token_data.username)
+    if settings.JWT_CLAIMS_MODE and "ver" in payload:
+        user = await get_current_user_from_claims(payload, db)
+        if user is None:
+            raise credentials_exception
+        return user
 
+    user = await get_principal(db, token_data.username)
     if user is None:
         raise credentials_exception
     return user
 
 
+async def get_principal(db: AsyncSession, username: str) -> Union[schemas.Employee, None]:
+    user = principals.cache.get(username)
+    if user is not None:
+        return user
+    db_user = await crud.get_employee_by_username(db=db, username=username)
+    if db_user is None:
+        return None
+    user = schemas.Employee.from_orm(db_user)
+    principals.cache.set(user.username, user)
+    return user
+
+
 async def get_current_active_user(current_user: schemas.Employee = Depends(get_current_user)):
     return current_user
 
@@ -81,89 +213,279 @@ async def get_current_admin_user(current_user: schemas.Employee = Depends(get_cu
     return current_user
 
 
+def get_after_id(cursor: Union[str, None] = None) -> Union[int, None]:
+    if cursor is None:
+        return None
+    try:
+        return pagination.decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, items: list, limit: int):
+    if items and len(items) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_cursor(items[-1].id)
+
+
+def get_history_after(cursor: Union[str, None] = None) -> Union[tuple, None]:
+    if cursor is None:
+        return None
+    try:
+        return pagination.decode_history_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def salary_history(db: AsyncSession, response: Response, employee_id: int,
+                         received_from: Union[datetime, None], received_to: Union[datetime, None],
+                         as_of: Union[datetime, None], after: Union[tuple, None], limit: int):
+    salaries = await crud.get_salary_history(db, employee_id, received_from, received_to, as_of, after, limit)
+    if salaries and len(salaries) == limit:
+        response.headers["X-Next-Cursor"] = pagination.encode_history_cursor(salaries[-1].received_at,
+                                                                             salaries[-1].id)
+    return salaries
+
+
+def get_fields(schema):
+    allowed = list(schema.__fields__)
+
+    def parse_fields(fields: Union[str, None] = Query(None, description="Comma-separated response fields")):
+        try:
+            return projection.parse_fields(fields, allowed)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    return parse_fields
+
+
+async def list_rows(db: AsyncSession, response: Response, model, fields: List[str], skip: int, limit: int,
+                    after_id: Union[int, None], where: list = ()) -> Response:
+    # the cursor needs the id even when the client didn't ask for it
+    rows = await crud.get_rows(db, model, fields if "id" in fields else fields + ["id"], skip, limit, after_id,
+                               where)
+    set_next_cursor(response, rows, limit)
+    return projection.json_response(fields, rows, headers=dict(response.headers))
+
+
 @app.post("/token", response_model=schemas.Token, tags=["user"])
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: AsyncSession = Depends(get_db)):
+    # rejected before the password is verified, so a flood of logins doesn't take the CPU from other routes
+    client_ip = request.client.host if request.client else ""
+    retry_after = await rate_limit.login_limiter.check(form_data.username, client_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await rate_limit.login_limiter.record_success(form_data.username)
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=access_token_claims(user), expires_delta=access_token_expires
+    )
+    # client_id names the device, so its refresh tokens can be revoked separately
+    refresh_token = await crud.create_refresh_token(db, user, form_data.client_id or "", refresh_token_expires_at())
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+# exchanges a refresh token for a new access token and a new refresh token, the old one stops working
+@app.post("/token/refresh", response_model=schemas.Token, tags=["user"])
+async def refresh_access_token(refresh_token: str = Form(...), db: AsyncSession = Depends(get_db)):
+    rotated = await crud.rotate_refresh_token(db, refresh_token, refresh_token_expires_at())
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, new_refresh_token = rotated
+    access_token = create_access_token(
+        data=access_token_claims(user), expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
+
+
+# logout: unknown tokens are not an error, the outcome is the same
+@app.post("/token/revoke", tags=["user"])
+async def revoke_refresh_token(refresh_token: str = Form(...), db: AsyncSession = Depends(get_db)):
+    await crud.revoke_refresh_token(db, refresh_token)
+    return {"detail": "Token revoked"}
+
+
+# without a device every refresh token of the user is revoked
+@app.delete("/users/me/refresh-tokens", tags=["user"])
+async def revoke_own_refresh_tokens(device: Union[str, None] = None,
+                                    current_user: schemas.Employee = Depends(get_current_active_user),
+                                    db: AsyncSession = Depends(get_db)):
+    return {"revoked": await crud.revoke_refresh_tokens(db, current_user.id, device)}
 
 
 @app.get("/users/me/", response_model=schemas.Employee, tags=["user"])
-async def read_users_me(current_user: schemas.Employee = Depends(get_current_active_user)):
+async def read_users_me(current_user: schemas.Employee = Depends(get_current_active_user),
+                        db: AsyncSession = Depends(get_read_db)):
+    if settings.JWT_CLAIMS_MODE:
+        # names are not in the claims, they come from the principal cache the default mode authenticates with
+        user = await get_principal(db, current_user.username)
+        if user is None:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        return user
     return current_user
 
 
 @app.get("/users/me/salary/", response_model=schemas.Salary, tags=["user"])
-async def read_own_salary(current_user: schemas.Employee = Depends(get_current_active_user),
-                          db: Session = Depends(get_db)):
-    own_salary = crud.get_own_salary(db, current_user.id)
+async def read_own_salary(request: Request, response: Response,
+                          current_user: schemas.Employee = Depends(get_current_active_user),
+                          db: AsyncSession = Depends(get_read_db)):
+    if etags.is_conditional(request):
+        latest = await crud.get_own_latest_version(db, models.Salary, current_user.id)
+        if latest is not None and etags.is_fresh(request, etags.row_etag("salary", *latest)):
+            return etags.not_modified(etags.row_etag("salary", *latest))
+    own_salary = await crud.get_own_salary(db, current_user.id)
     if not own_salary:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Salary not found",
         )
+    response.headers["ETag"] = etags.row_etag("salary", own_salary.id, own_salary.version)
     return own_salary
 
 
+# newest first; as_of=<date>&limit=1 gives the salary in effect on that date
+@app.get("/users/me/salary/history", response_model=List[schemas.Salary], tags=["user"])
+async def read_own_salary_history(response: Response, received_from: Union[datetime, None] = None,
+                                  received_to: Union[datetime, None] = None, as_of: Union[datetime, None] = None,
+                                  limit: int = Query(24, ge=1, le=1000),
+                                  after: Union[tuple, None] = Depends(get_history_after),
+                                  current_user: schemas.Employee = Depends(get_current_active_user),
+                                  db: AsyncSession = Depends(get_read_db)):
+    return await salary_history(db, response, current_user.id, received_from, received_to, as_of, after, limit)
+
+
 @app.get("/users/me/promotion/", response_model=schemas.Promotion, tags=["user"])
-async def read_own_promotion(current_user: schemas.Employee = Depends(get_current_active_user),
-                             db: Session = Depends(get_db)):
-    own_promotion = crud.get_own_promotion(db, current_user.id)
+async def read_own_promotion(request: Request, response: Response,
+                             current_user: schemas.Employee = Depends(get_current_active_user),
+                             db: AsyncSession = Depends(get_read_db)):
+    if etags.is_conditional(request):
+        latest = await crud.get_own_latest_version(db, models.Promotion, current_user.id)
+        if latest is not None and etags.is_fresh(request, etags.row_etag("promotion", *latest)):
+            return etags.not_modified(etags.row_etag("promotion", *latest))
+    own_promotion = await crud.get_own_promotion(db, current_user.id)
     if not own_promotion:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Promotion not found",
         )
+    response.headers["ETag"] = etags.row_etag("promotion", own_promotion.id, own_promotion.version)
     return own_promotion
 
 
+# profile, latest salary and promotion, and optionally the last `history` salaries in one call
+@app.get("/users/me/compensation/", response_model=schemas.Compensation, tags=["user"])
+async def read_own_compensation(history: int = Query(0, ge=0, le=120),
+                                current_user: schemas.Employee = Depends(get_current_active_user),
+                                db: AsyncSession = Depends(get_read_db)):
+    rows = await crud.get_own_compensation(db, current_user.id, history)
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Employee not found",
+        )
+    employee, salary, promotion = rows[0]
+    return schemas.Compensation(employee=employee, salary=salary, promotion=promotion,
+                                salary_history=[row[1] for row in rows if row[1] is not None][:history])
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # ADMIN
+@app.get("/admin/hashing/stats", tags=["admin"])
+async def read_hashing_stats(current_user: schemas.Employee = Depends(get_current_admin_user)):
+    return hashing.pool.stats()
+
+
 # EMPLOYEES
 # CREATE
 @app.post("/admin/employees/", response_model=schemas.Employee, tags=["admin"])
-def create_employee(employee: schemas.EmployeeCreate,
-                    current_user: schemas.Employee = Depends(get_current_admin_user),
-                    db: Session = Depends(get_db)):
-    db_employee = crud.get_employee_by_username(db, username=employee.username)
+async def create_employee(employee: schemas.EmployeeCreate,
+                          current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_db)):
+    db_employee = await crud.get_employee_by_username(db, username=employee.username)
     if db_employee:
         raise HTTPException(status_code=400,
                             detail="Username already registered")
-    return crud.create_employee(db, employee=employee)
+    return await crud.create_employee(db, employee=employee)
 
 
 # READ (MANY)
 @app.get("/admin/employees/", response_model=List[schemas.Employee], tags=["admin"])
-def read_employees(skip: int = 0, limit: int = 100,
-                   current_user: schemas.Employee = Depends(get_current_admin_user),
-                   db: Session = Depends(get_db)):
-    return crud.get_employees(db, skip, limit)
+@response_cache.cache.cached("employee", List[schemas.Employee])
+async def read_employees(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                         after_id: Union[int, None] = Depends(get_after_id),
+                         fields: List[str] = Depends(get_fields(schemas.Employee)),
+                         q: Union[str, None] = Query(None, description="Search by username, first or last name"),
+                         current_user: schemas.Employee = Depends(get_current_admin_user),
+                         db: AsyncSession = Depends(get_read_db)):
+    etag = etags.collection_etag("employee", await crud.get_table_version(db, "employee"), request)
+    if etags.is_fresh(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    return await list_rows(db, response, models.Employee, fields, skip, limit, after_id,
+                           crud.employee_search_filters(q))
 
 
 # READ (ONE)
-@app.get("/admin/employees/{employee_id}", response_model=schemas.Salary, tags=["admin"])
-def read_employee(employee_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
-                  db: Session = Depends(get_db)):
-    user = crud.get_employee(db=db, user_id=employee_id)
+@app.get("/admin/employees/{employee_id}", response_model=schemas.Employee, tags=["admin"])
+@response_cache.cache.cached("employee", schemas.Employee, id_param="employee_id")
+async def read_employee(employee_id: int, request: Request, response: Response,
+                        current_user: schemas.Employee = Depends(get_current_admin_user),
+                        db: AsyncSession = Depends(get_read_db)):
+    if etags.is_conditional(request):
+        version = await crud.get_row_version(db, models.Employee, employee_id)
+        if version is not None and etags.is_fresh(request, etags.row_etag("employee", employee_id, version)):
+            return etags.not_modified(etags.row_etag("employee", employee_id, version))
+    user = await crud.get_employee(db=db, user_id=employee_id)
     if user is None:
         raise HTTPException(status_code=404, detail="Employee not found")
+    response.headers["ETag"] = etags.row_etag("employee", user.id, user.version)
     return user
 
 
 # UPDATE
 @app.put("/admin/employees/{employee_id}", response_model=schemas.Employee, tags=["admin"])
-def update_employee(employee_id: int, employee: schemas.EmployeeCreate,
-                    current_user: schemas.Employee = Depends(get_current_admin_user),
-                    db: Session = Depends(get_db)):
-    db_employee = crud.update_employee(db=db, employee_id=employee_id, employee=employee)
+async def update_employee(employee_id: int, employee: schemas.EmployeeCreate,
+                          current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_db)):
+    try:
+        db_employee = await crud.update_employee(db=db, employee_id=employee_id, employee=employee)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Username already registered")
+    if db_employee is None:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    return db_employee
+
+
+# UPDATE (PARTIAL)
+@app.patch("/admin/employees/{employee_id}", response_model=schemas.Employee, tags=["admin"])
+async def patch_employee(employee_id: int, employee: schemas.EmployeeUpdate,
+                         current_user: schemas.Employee = Depends(get_current_admin_user),
+                         db: AsyncSession = Depends(get_db)):
+    try:
+        db_employee = await crud.patch_employee(db=db, employee_id=employee_id, employee=employee)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Username already registered")
     if db_employee is None:
         raise HTTPException(status_code=404, detail="Employee not found")
     return db_employee
@@ -171,44 +493,118 @@ def update_employee(employee_id: int, employee: schemas.EmployeeCreate,
 
 # DELETE
 @app.delete("/admin/employees/{employee_id}", tags=["admin"])
-def delete_employee(employee_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
-                    db: Session = Depends(get_db)):
-    db_employee = crud.delete_employee(db=db, employee_id=employee_id)
+async def delete_employee(employee_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_db)):
+    db_employee = await crud.delete_employee(db=db, employee_id=employee_id)
     if not db_employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     return {"detail": "Employee deleted"}
 
 
+# REFRESH TOKENS
+@app.delete("/admin/employees/{employee_id}/refresh-tokens", tags=["admin"])
+async def revoke_employee_refresh_tokens(employee_id: int, device: Union[str, None] = None,
+                                         current_user: schemas.Employee = Depends(get_current_admin_user),
+                                         db: AsyncSession = Depends(get_db)):
+    return {"revoked": await crud.revoke_refresh_tokens(db, employee_id, device)}
+
+
 # SALARIES
 # CREATE
 @app.post("/admin/salaries/", response_model=schemas.Salary, tags=["admin"])
-def create_salary(salary: schemas.SalaryCreate, current_user: schemas.Employee = Depends(get_current_admin_user),
-                  db: Session = Depends(get_db)):
-    return crud.create_salary(db=db, salary=salary)
+async def create_salary(salary: schemas.SalaryCreate, current_user: schemas.Employee = Depends(get_current_admin_user),
+                        db: AsyncSession = Depends(get_db)):
+    return await crud.create_salary(db=db, salary=salary)
+
+
+# CREATE (MANY)
+# accepts a JSON array, NDJSON (application/x-ndjson) or CSV (text/csv) body
+@app.post("/admin/salaries/bulk", response_model=schemas.BulkReport, tags=["admin"])
+async def create_salaries(request: Request, current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_db)):
+    # the report can be large, it is already plain JSON so skip response_model validation
+    report = await bulk.ingest(db, bulk.read_records(request), schemas.SalaryCreate, crud.create_salaries,
+                               "salary")
+    return JSONResponse(report)
 
 
 # READ (MANY)
 @app.get("/admin/salaries/", response_model=List[schemas.Salary], tags=["admin"])
-def read_salaries(skip: int = 0, limit: int = 100, current_user: schemas.Employee = Depends(get_current_admin_user),
-                  db: Session = Depends(get_db)):
-    return crud.get_salaries(db=db, skip=skip, limit=limit)
+@response_cache.cache.cached("salary", List[schemas.Salary])
+async def read_salaries(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                        after_id: Union[int, None] = Depends(get_after_id),
+                        fields: List[str] = Depends(get_fields(schemas.Salary)),
+                        employee_id: Union[int, None] = None, is_received: Union[bool, None] = None,
+                        received_from: Union[datetime, None] = None, received_to: Union[datetime, None] = None,
+                        total_min: Union[float, None] = None, total_max: Union[float, None] = None,
+                        current_user: schemas.Employee = Depends(get_current_admin_user),
+                        db: AsyncSession = Depends(get_read_db)):
+    etag = etags.collection_etag("salary", await crud.get_table_version(db, "salary"), request)
+    if etags.is_fresh(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    where = crud.received_filters(models.Salary, employee_id, received_from, received_to, is_received) + \
+        crud.total_filters(total_min, total_max)
+    return await list_rows(db, response, models.Salary, fields, skip, limit, after_id, where)
+
+
+# HISTORY
+@app.get("/admin/employees/{employee_id}/salary/history", response_model=List[schemas.Salary], tags=["admin"])
+async def read_salary_history(employee_id: int, response: Response, received_from: Union[datetime, None] = None,
+                              received_to: Union[datetime, None] = None, as_of: Union[datetime, None] = None,
+                              limit: int = Query(24, ge=1, le=1000),
+                              after: Union[tuple, None] = Depends(get_history_after),
+                              current_user: schemas.Employee = Depends(get_current_admin_user),
+                              db: AsyncSession = Depends(get_read_db)):
+    return await salary_history(db, response, employee_id, received_from, received_to, as_of, after, limit)
+
+
+# EXPORT
+@app.get("/admin/salaries/export", tags=["admin"])
+async def export_salaries(format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+                          employee_id: Union[int, None] = None,
+                          received_from: Union[datetime, None] = None, received_to: Union[datetime, None] = None,
+                          current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_read_db)):
+    query = crud.select_salaries_for_export(employee_id, received_from, received_to)
+    return StreamingResponse(export.stream_rows(db, query, format), media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f"attachment; filename=salaries.{format}"})
 
 
 # READ (ONE)
 @app.get("/admin/salaries/{salary_id}", response_model=schemas.Salary, tags=["admin"])
-def read_salary(salary_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
-                db: Session = Depends(get_db)):
-    salary = crud.get_salary(db=db, salary_id=salary_id)
+@response_cache.cache.cached("salary", schemas.Salary, id_param="salary_id")
+async def read_salary(salary_id: int, request: Request, response: Response,
+                      current_user: schemas.Employee = Depends(get_current_admin_user),
+                      db: AsyncSession = Depends(get_read_db)):
+    if etags.is_conditional(request):
+        version = await crud.get_row_version(db, models.Salary, salary_id)
+        if version is not None and etags.is_fresh(request, etags.row_etag("salary", salary_id, version)):
+            return etags.not_modified(etags.row_etag("salary", salary_id, version))
+    salary = await crud.get_salary(db=db, salary_id=salary_id)
     if salary is None:
         raise HTTPException(status_code=404, detail="Salary not found")
+    response.headers["ETag"] = etags.row_etag("salary", salary.id, salary.version)
     return salary
 
 
 # UPDATE
 @app.put("/admin/salaries/{salary_id}", response_model=schemas.Salary, tags=["admin"])
-def update_salary(salary_id: int, salary: schemas.SalaryCreate,
-                  current_user: schemas.Employee = Depends(get_current_admin_user), db: Session = Depends(get_db)):
-    salary_updated = crud.update_salary(db=db, salary_id=salary_id, salary=salary)
+async def update_salary(salary_id: int, salary: schemas.SalaryCreate,
+                        current_user: schemas.Employee = Depends(get_current_admin_user),
+                        db: AsyncSession = Depends(get_db)):
+    salary_updated = await crud.update_salary(db=db, salary_id=salary_id, salary=salary)
+    if salary_updated is None:
+        raise HTTPException(status_code=404, detail="Salary not found")
+    return salary_updated
+
+
+# UPDATE (PARTIAL)
+@app.patch("/admin/salaries/{salary_id}", response_model=schemas.Salary, tags=["admin"])
+async def patch_salary(salary_id: int, salary: schemas.SalaryUpdate,
+                       current_user: schemas.Employee = Depends(get_current_admin_user),
+                       db: AsyncSession = Depends(get_db)):
+    salary_updated = await crud.patch_salary(db=db, salary_id=salary_id, salary=salary)
     if salary_updated is None:
         raise HTTPException(status_code=404, detail="Salary not found")
     return salary_updated
@@ -216,9 +612,9 @@ def update_salary(salary_id: int, salary: schemas.SalaryCreate,
 
 # DELETE
 @app.delete("/admin/salaries/{salary_id}", tags=["admin"])
-def delete_salary(salary_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
-                  db: Session = Depends(get_db)):
-    salary_deleted = crud.delete_salary(db=db, salary_id=salary_id)
+async def delete_salary(salary_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
+                        db: AsyncSession = Depends(get_db)):
+    salary_deleted = await crud.delete_salary(db=db, salary_id=salary_id)
     if not salary_deleted:
         raise HTTPException(status_code=404, detail="Salary not found")
     return {"detail": "Salary deleted"}
@@ -227,35 +623,85 @@ def delete_salary(salary_id: int, current_user: schemas.Employee = Depends(get_c
 # PROMOTIONS
 # CREATE
 @app.post("/promotions/", response_model=schemas.Promotion, tags=["admin"])
-def create_promotion(promotion: schemas.PromotionCreate,
-                     current_user: schemas.Employee = Depends(get_current_admin_user),
-                     db: Session = Depends(get_db)):
-    return crud.create_promotion(db=db, promotion=promotion)
+async def create_promotion(promotion: schemas.PromotionCreate,
+                           current_user: schemas.Employee = Depends(get_current_admin_user),
+                           db: AsyncSession = Depends(get_db)):
+    return await crud.create_promotion(db=db, promotion=promotion)
+
+
+# CREATE (MANY)
+@app.post("/admin/promotions/bulk", response_model=schemas.BulkReport, tags=["admin"])
+async def create_promotions(request: Request, current_user: schemas.Employee = Depends(get_current_admin_user),
+                            db: AsyncSession = Depends(get_db)):
+    report = await bulk.ingest(db, bulk.read_records(request), schemas.PromotionCreate, crud.create_promotions,
+                               "promotion")
+    return JSONResponse(report)
 
 
 # READ (MANY)
 @app.get("/admin/promotions/", response_model=List[schemas.Promotion], tags=["admin"])
-def read_promotions(skip: int = 0, limit: int = 100,
-                    current_user: schemas.Employee = Depends(get_current_admin_user),
-                    db: Session = Depends(get_db)):
-    return crud.get_promotions(db=db, skip=skip, limit=limit)
+@response_cache.cache.cached("promotion", List[schemas.Promotion])
+async def read_promotions(request: Request, response: Response, skip: int = 0, limit: int = 100,
+                          after_id: Union[int, None] = Depends(get_after_id),
+                          fields: List[str] = Depends(get_fields(schemas.Promotion)),
+                          employee_id: Union[int, None] = None, is_received: Union[bool, None] = None,
+                          received_from: Union[datetime, None] = None, received_to: Union[datetime, None] = None,
+                          current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_read_db)):
+    etag = etags.collection_etag("promotion", await crud.get_table_version(db, "promotion"), request)
+    if etags.is_fresh(request, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    where = crud.received_filters(models.Promotion, employee_id, received_from, received_to, is_received)
+    return await list_rows(db, response, models.Promotion, fields, skip, limit, after_id, where)
+
+
+# EXPORT
+@app.get("/admin/promotions/export", tags=["admin"])
+async def export_promotions(format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+                            employee_id: Union[int, None] = None,
+                            received_from: Union[datetime, None] = None, received_to: Union[datetime, None] = None,
+                            current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_read_db)):
+    query = crud.select_promotions_for_export(employee_id, received_from, received_to)
+    return StreamingResponse(export.stream_rows(db, query, format), media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f"attachment; filename=promotions.{format}"})
 
 
 # READ (ONE)
 @app.get("/promotions/{promotion_id}", response_model=schemas.Promotion, tags=["admin"])
-def read_promotion(promotion_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
-                   db: Session = Depends(get_db)):
-    promotion = crud.get_promotion(db=db, promotion_id=promotion_id)
+@response_cache.cache.cached("promotion", schemas.Promotion, id_param="promotion_id")
+async def read_promotion(promotion_id: int, request: Request, response: Response,
+                         current_user: schemas.Employee = Depends(get_current_admin_user),
+                         db: AsyncSession = Depends(get_read_db)):
+    if etags.is_conditional(request):
+        version = await crud.get_row_version(db, models.Promotion, promotion_id)
+        if version is not None and etags.is_fresh(request, etags.row_etag("promotion", promotion_id, version)):
+            return etags.not_modified(etags.row_etag("promotion", promotion_id, version))
+    promotion = await crud.get_promotion(db=db, promotion_id=promotion_id)
     if promotion is None:
         raise HTTPException(status_code=404, detail="Promotion not found")
+    response.headers["ETag"] = etags.row_etag("promotion", promotion.id, promotion.version)
     return promotion
 
 
 # UPDATE
 @app.put("/promotions/{promotion_id}", response_model=schemas.Promotion, tags=["admin"])
-def update_promotion(promotion_id: int, promotion: schemas.PromotionCreate,
-                     current_user: schemas.Employee = Depends(get_current_admin_user), db: Session = Depends(get_db)):
-    promotion_updated = crud.update_promotion(db=db, promotion_id=promotion_id, promotion=promotion)
+async def update_promotion(promotion_id: int, promotion: schemas.PromotionCreate,
+                           current_user: schemas.Employee = Depends(get_current_admin_user),
+                           db: AsyncSession = Depends(get_db)):
+    promotion_updated = await crud.update_promotion(db=db, promotion_id=promotion_id, promotion=promotion)
+    if promotion_updated is None:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+    return promotion_updated
+
+
+# UPDATE (PARTIAL)
+@app.patch("/promotions/{promotion_id}", response_model=schemas.Promotion, tags=["admin"])
+async def patch_promotion(promotion_id: int, promotion: schemas.PromotionUpdate,
+                          current_user: schemas.Employee = Depends(get_current_admin_user),
+                          db: AsyncSession = Depends(get_db)):
+    promotion_updated = await crud.patch_promotion(db=db, promotion_id=promotion_id, promotion=promotion)
     if promotion_updated is None:
         raise HTTPException(status_code=404, detail="Promotion not found")
     return promotion_updated
@@ -263,9 +709,47 @@ def update_promotion(promotion_id: int, promotion: schemas.PromotionCreate,
 
 # DELETE
 @app.delete("/promotions/{promotion_id}", tags=["admin"])
-def delete_promotion(promotion_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
-                     db: Session = Depends(get_db)):
-    promotion_deleted = crud.delete_promotion(db=db, promotion_id=promotion_id)
+async def delete_promotion(promotion_id: int, current_user: schemas.Employee = Depends(get_current_admin_user),
+                           db: AsyncSession = Depends(get_db)):
+    promotion_deleted = await crud.delete_promotion(db=db, promotion_id=promotion_id)
     if not promotion_deleted:
         raise HTTPException(status_code=404, detail="Promotion not found")
     return {"detail": "Promotion deleted"}
+
+
+# REPORTS
+MONTH_PATTERN = "^[0-9]{4}-[0-9]{2}$"
+
+
+@app.get("/admin/reports/payroll/by-employee", response_model=List[schemas.PayrollByEmployee], tags=["reports"])
+async def read_payroll_by_employee(employee_id: Union[int, None] = None,
+                                   month_from: Union[str, None] = Query(None, regex=MONTH_PATTERN),
+                                   month_to: Union[str, None] = Query(None, regex=MONTH_PATTERN),
+                                   current_user: schemas.Employee = Depends(get_current_admin_user),
+                                   db: AsyncSession = Depends(get_read_db)):
+    return await crud.get_payroll_by_employee(db, employee_id, month_from, month_to)
+
+
+@app.get("/admin/reports/payroll/by-month", response_model=List[schemas.PayrollByMonth], tags=["reports"])
+async def read_payroll_by_month(employee_id: Union[int, None] = None,
+                                month_from: Union[str, None] = Query(None, regex=MONTH_PATTERN),
+                                month_to: Union[str, None] = Query(None, regex=MONTH_PATTERN),
+                                current_user: schemas.Employee = Depends(get_current_admin_user),
+                                db: AsyncSession = Depends(get_read_db)):
+    return await crud.get_payroll_by_month(db, employee_id, month_from, month_to)
+
+
+@app.get("/admin/reports/payroll/by-status", response_model=List[schemas.PayrollByStatus], tags=["reports"])
+async def read_payroll_by_status(employee_id: Union[int, None] = None,
+                                 month_from: Union[str, None] = Query(None, regex=MONTH_PATTERN),
+                                 month_to: Union[str, None] = Query(None, regex=MONTH_PATTERN),
+                                 current_user: schemas.Employee = Depends(get_current_admin_user),
+                                 db: AsyncSession = Depends(get_read_db)):
+    return await crud.get_payroll_by_status(db, employee_id, month_from, month_to)
+
+
+@app.get("/admin/reports/promotions/upcoming", response_model=List[schemas.UpcomingPromotions], tags=["reports"])
+async def read_upcoming_promotions(period: str = Query("month", regex="^(day|week|month|year)$"),
+                                   current_user: schemas.Employee = Depends(get_current_admin_user),
+                                   db: AsyncSession = Depends(get_read_db)):
+    return await crud.get_upcoming_promotions(db, period)
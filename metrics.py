@@ -0,0 +1,200 @@
+import inspect
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# request, query, connection pool and password hashing metrics, exposed in Prometheus text format at /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        registry.append(self)
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield self.name + _format_labels(self.labels, values), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name} {value}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        # per-bucket counts plus the +Inf bucket, sum and count; made cumulative when rendered
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self):
+        for values, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket" + _format_labels(self.labels, values, f'le="{bound}"'), cumulative
+            yield f"{self.name}_sum" + _format_labels(self.labels, values), series[-2]
+            yield f"{self.name}_count" + _format_labels(self.labels, values), series[-1]
+
+
+registry = []
+
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests being handled", ("method", "route"))
+http_request_duration = Histogram("http_request_duration_seconds", "Request handling time",
+                                  ("method", "route", "status"))
+db_queries_per_request = Histogram("db_queries_per_request", "SQL statements executed per request",
+                                   ("method", "route"), QUERY_COUNT_BUCKETS)
+db_query_duration = Histogram("db_query_duration_seconds", "SQL statement execution time", ("route",))
+db_connection_wait = Histogram("db_connection_wait_seconds", "Time spent waiting for a pooled connection")
+password_hash_duration = Histogram("password_hash_duration_seconds", "bcrypt hashing or verification time")
+password_hash_wait = Histogram("password_hash_wait_seconds", "Time a hashing job waited for a free worker")
+background_task_duration = Histogram("background_task_duration_seconds", "Periodic task run time", ("task",))
+background_task_failures = Counter("background_task_failures_total", "Periodic task runs that raised", ("task",))
+settled_rows = Counter("settled_rows_total", "Due salaries and promotions marked received", ("table",))
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+# REQUESTS
+class RequestStats:
+    __slots__ = ("route", "queries")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.queries = 0
+
+
+# statements executed outside a request (startup, streamed response bodies) are counted under route=""
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+async def _handled_status(request, exc: Exception) -> int:
+    # the status of the response the app's exception handlers turn `exc` into, 500 if nobody handles it
+    for cls in type(exc).__mro__:
+        handler = request.app.exception_handlers.get(cls)
+        if handler is None:
+            continue
+        try:
+            response = handler(request, exc)
+            if inspect.isawaitable(response):
+                response = await response
+            return response.status_code
+        except Exception:
+            # the exception middleware runs the handler again and reports its failure
+            return 500
+    return 500
+
+
+class MetricsRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def timed_handler(request):
+            method = request.method
+            stats = RequestStats(route)
+            token = _request_stats.set(stats)
+            http_requests_in_flight.inc(method, route)
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except Exception as exc:
+                status = await _handled_status(request, exc)
+                raise
+            finally:
+                http_request_duration.observe(time.perf_counter() - started, method, route, str(status))
+                db_queries_per_request.observe(stats.queries, method, route)
+                http_requests_in_flight.dec(method, route)
+                _request_stats.reset(token)
+
+        return timed_handler
+
+
+# DATABASE
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+    db_query_duration.observe(elapsed, stats.route if stats is not None else "")
+
+
+def _handle_error(context):
+    # a statement that raises never reaches after_cursor_execute, its start time must not pair with the next one
+    if context.connection is not None and context.connection.info.get("metrics_started"):
+        context.connection.info["metrics_started"].pop()
+
+
+def instrument_engine(engine):
+    # engine is the sync engine, for async engines pass engine.sync_engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    # the pool has no event that fires before a checkout starts waiting, so the wait is timed here
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_connection_wait.observe(time.perf_counter() - started)
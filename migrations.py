@@ -0,0 +1,152 @@
+import argparse
+import logging
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import models
+from fill_db import fill_db
+
+logger = logging.getLogger("migrations")
+
+# the schema version of a database is stored in a single-row table next to the data
+metadata = sa.MetaData()
+schema_version = sa.Table("schema_version", metadata, sa.Column("version", sa.Integer, nullable=False))
+
+
+# MIGRATIONS
+# each migration must be idempotent: databases created before versioning may already have some changes
+def _add_employee_token_version(connection):
+    columns = {column["name"] for column in sa.inspect(connection).get_columns("employee")}
+    if "token_version" not in columns:
+        connection.execute(sa.text("ALTER TABLE employee ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def _add_employee_id_indexes(connection):
+    for table in ("salary", "promotion"):
+        connection.execute(sa.text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_employee_id_id ON {table} (employee_id, id)"))
+        connection.execute(sa.text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_employee_id_received_at ON {table} (employee_id, received_at)"))
+
+
+def _add_payroll_summary(connection):
+    models.PayrollSummary.__table__.create(connection, checkfirst=True)
+    for statement in models.PAYROLL_SUMMARY_BACKFILL:
+        connection.exec_driver_sql(statement)
+    for trigger in models.PAYROLL_SUMMARY_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+    connection.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_promotion_is_received_received_at ON promotion (is_received, received_at)"))
+
+
+def _add_row_versions(connection):
+    for table in models.VERSIONED_TABLES:
+        columns = {column["name"] for column in sa.inspect(connection).get_columns(table)}
+        if "version" not in columns:
+            connection.execute(sa.text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+    models.TableVersion.__table__.create(connection, checkfirst=True)
+    for table in models.VERSIONED_TABLES:
+        connection.execute(sa.text("INSERT OR IGNORE INTO table_version (name, version) VALUES (:name, 1)"),
+                           {"name": table})
+    for trigger in models.TABLE_VERSION_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+
+
+def _add_filter_indexes_and_employee_search(connection):
+    for index in (models.Salary.__table__.indexes | models.Promotion.__table__.indexes):
+        index.create(connection, checkfirst=True)
+    for statement in models.EMPLOYEE_FTS_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(models.EMPLOYEE_FTS_REBUILD)
+
+
+def _add_refresh_tokens(connection):
+    models.RefreshToken.__table__.create(connection, checkfirst=True)
+
+
+def _add_employee_autoincrement(connection):
+    # SQLite can't alter the primary key, so the table is rebuilt; its triggers go with the old table
+    ddl = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'employee'").scalar()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    columns = ", ".join(column.name for column in models.Employee.__table__.columns)
+    employee_new = models.Employee.__table__.to_metadata(sa.MetaData(), name="employee_new")
+    connection.execute(sa.schema.CreateTable(employee_new))
+    connection.exec_driver_sql(f"INSERT INTO employee_new ({columns}) SELECT {columns} FROM employee")
+    connection.exec_driver_sql("DROP TABLE employee")
+    connection.exec_driver_sql("ALTER TABLE employee_new RENAME TO employee")
+    for index in models.Employee.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    for trigger in models.TABLE_VERSION_TRIGGERS + models.EMPLOYEE_FTS_DDL:
+        connection.exec_driver_sql(trigger)
+
+
+def _add_task_leases(connection):
+    models.TaskLease.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, "add employee.token_version", _add_employee_token_version),
+    (2, "index salary and promotion by employee_id", _add_employee_id_indexes),
+    (3, "add payroll_summary", _add_payroll_summary),
+    (4, "add row and table versions", _add_row_versions),
+    (5, "add list filter indexes and employee search", _add_filter_indexes_and_employee_search),
+    (6, "add refresh tokens", _add_refresh_tokens),
+    (7, "never reuse employee ids", _add_employee_autoincrement),
+    (8, "add task leases", _add_task_leases),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection) -> int:
+    if not sa.inspect(connection).has_table("schema_version"):
+        return 0
+    return connection.execute(sa.select(schema_version.c.version)).scalar() or 0
+
+
+def _set_version(connection, version: int):
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert().values(version=version))
+
+
+def upgrade(engine: sa.Engine) -> bool:
+    # brings the schema up to date, returns True if the database was created from scratch
+    with engine.begin() as connection:
+        if not sa.inspect(connection).get_table_names():
+            models.Base.metadata.create_all(connection)
+            metadata.create_all(connection)
+            _set_version(connection, LATEST_VERSION)
+            return True
+        metadata.create_all(connection)
+
+    for version, description, migrate in MIGRATIONS:
+        with engine.begin() as connection:
+            if get_version(connection) >= version:
+                continue
+            logger.info("applying migration %d: %s", version, description)
+            migrate(connection)
+            _set_version(connection, version)
+    return False
+
+
+def bootstrap(engine: sa.Engine, seed: bool = False):
+    if upgrade(engine) and seed:
+        fill_db(Session(engine))
+
+
+if __name__ == "__main__":
+    import settings
+
+    parser = argparse.ArgumentParser(description="Manage the database schema")
+    parser.add_argument("command", choices=["upgrade", "version"], nargs="?", default="version")
+    parser.add_argument("--seed", action="store_true", default=settings.SEED_DB,
+                        help="fill a newly created database with demo employees")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    engine = settings.get_engine()
+    if args.command == "upgrade":
+        bootstrap(engine, args.seed)
+    with engine.connect() as connection:
+        print(f"Schema version: {get_version(connection)}")
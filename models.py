@@ -1,7 +1,7 @@
 import uuid
 from datetime import timedelta, datetime
 
-from sqlalchemy import Column, Integer, Numeric, String, DateTime, Boolean, ForeignKey, func
+from sqlalchemy import Column, Integer, Numeric, String, DateTime, Boolean, ForeignKey, Index, column, event, func, table
 from sqlalchemy.orm import DeclarativeBase
 
 
@@ -11,6 +11,8 @@ class Base(DeclarativeBase):
 
 class Employee(Base):
     __tablename__ = "employee"
+    # ids of deleted employees are never handed out again, tokens carry the id and token version
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(length=128), unique=True)
@@ -18,6 +20,8 @@ class Employee(Base):
     firstname = Column(String(length=128))
     lastname = Column(String(length=128))
     is_admin = Column(Boolean, default=False)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     def __repr__(self) -> str:
         return f"Employee(id={self.id!r}," \
@@ -29,6 +33,13 @@ class Employee(Base):
 
 class Salary(Base):
     __tablename__ = "salary"
+    __table_args__ = (
+        Index("ix_salary_employee_id_id", "employee_id", "id"),
+        Index("ix_salary_employee_id_received_at", "employee_id", "received_at"),
+        Index("ix_salary_is_received_received_at", "is_received", "received_at"),
+        Index("ix_salary_received_at", "received_at"),
+        Index("ix_salary_total", "total"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey('employee.id'))
@@ -36,6 +47,7 @@ class Salary(Base):
     created_at = Column(DateTime, default=datetime.now())
     received_at = Column(DateTime, default=datetime.now() + timedelta(days=30))
     is_received = Column(Boolean, default=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     def __repr__(self) -> str:
         return f"Salary(id={self.id!r}," \
@@ -48,12 +60,19 @@ class Salary(Base):
 
 class Promotion(Base):
     __tablename__ = "promotion"
+    __table_args__ = (
+        Index("ix_promotion_employee_id_id", "employee_id", "id"),
+        Index("ix_promotion_employee_id_received_at", "employee_id", "received_at"),
+        Index("ix_promotion_is_received_received_at", "is_received", "received_at"),
+        Index("ix_promotion_received_at", "received_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey('employee.id'))
     created_at = Column(DateTime, default=datetime.now())
     received_at = Column(DateTime, default=datetime.now() + timedelta(days=30))
     is_received = Column(Boolean, default=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     def __repr__(self) -> str:
         return f"Promotion(id={self.id!r}," \
@@ -61,3 +80,152 @@ class Promotion(Base):
                f"created_at={self.created_at!r}," \
                f"received_at={self.received_at!r}," \
                f"is_received={self.is_received!r})"
+
+
+class PayrollSummary(Base):
+    # salary totals per employee, month of received_at and is_received, kept up to date by the triggers below
+    __tablename__ = "payroll_summary"
+
+    employee_id = Column(Integer, primary_key=True)
+    month = Column(String(length=7), primary_key=True)
+    is_received = Column(Boolean, primary_key=True)
+    total = Column(Numeric, nullable=False, default=0)
+    salaries = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f"PayrollSummary(employee_id={self.employee_id!r}," \
+               f"month={self.month!r}," \
+               f"is_received={self.is_received!r}," \
+               f"total={self.total!r}," \
+               f"salaries={self.salaries!r})"
+
+
+class TableVersion(Base):
+    # bumped by triggers on every insert, update and delete, used as the ETag of list endpoints
+    __tablename__ = "table_version"
+
+    name = Column(String(length=64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f"TableVersion(name={self.name!r}," \
+               f"version={self.version!r})"
+
+
+class RefreshToken(Base):
+    # refresh tokens are random and high-entropy, so only their sha256 is stored; token_version is the
+    # employee's at issue time, a new password, username or role invalidates the token like it does access tokens
+    __tablename__ = "refresh_token"
+    __table_args__ = (
+        Index("ix_refresh_token_employee_id_device", "employee_id", "device"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(length=64), unique=True, nullable=False)
+    employee_id = Column(Integer, ForeignKey('employee.id'), nullable=False)
+    device = Column(String(length=128), nullable=False, default="")
+    token_version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"RefreshToken(id={self.id!r}," \
+               f"employee_id={self.employee_id!r}," \
+               f"device={self.device!r}," \
+               f"expires_at={self.expires_at!r})"
+
+
+class TaskLease(Base):
+    # background tasks that must run in one worker at a time take the lease of their name before each run
+    __tablename__ = "task_lease"
+
+    name = Column(String(length=64), primary_key=True)
+    owner = Column(String(length=32), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"TaskLease(name={self.name!r}," \
+               f"owner={self.owner!r}," \
+               f"expires_at={self.expires_at!r})"
+
+
+def _payroll_summary_key(row: str) -> str:
+    return f"COALESCE({row}.employee_id, 0), COALESCE(strftime('%Y-%m', {row}.received_at), ''), " \
+           f"COALESCE({row}.is_received, 0)"
+
+
+def _payroll_summary_add(row: str) -> str:
+    return f"""INSERT INTO payroll_summary (employee_id, month, is_received, total, salaries)
+        VALUES ({_payroll_summary_key(row)}, COALESCE({row}.total, 0), 1)
+        ON CONFLICT (employee_id, month, is_received)
+        DO UPDATE SET total = total + excluded.total, salaries = salaries + 1;"""
+
+
+def _payroll_summary_subtract(row: str) -> str:
+    key = "(employee_id, month, is_received) = (" + _payroll_summary_key(row) + ")"
+    return f"""UPDATE payroll_summary SET total = total - COALESCE({row}.total, 0), salaries = salaries - 1
+        WHERE {key};
+        DELETE FROM payroll_summary WHERE {key} AND salaries <= 0;"""
+
+
+PAYROLL_SUMMARY_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS payroll_summary_salary_insert AFTER INSERT ON salary BEGIN
+        {_payroll_summary_add("NEW")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS payroll_summary_salary_update
+    AFTER UPDATE OF employee_id, total, received_at, is_received ON salary BEGIN
+        {_payroll_summary_subtract("OLD")}
+        {_payroll_summary_add("NEW")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS payroll_summary_salary_delete AFTER DELETE ON salary BEGIN
+        {_payroll_summary_subtract("OLD")}
+    END""",
+]
+
+# recomputes the summary from scratch, for migrations and bulk loads that bypass the triggers
+PAYROLL_SUMMARY_BACKFILL = [
+    "DELETE FROM payroll_summary",
+    "INSERT INTO payroll_summary (employee_id, month, is_received, total, salaries) "
+    "SELECT COALESCE(employee_id, 0), COALESCE(strftime('%Y-%m', received_at), ''), COALESCE(is_received, 0), "
+    "SUM(COALESCE(total, 0)), COUNT(*) FROM salary GROUP BY 1, 2, 3",
+]
+
+VERSIONED_TABLES = ["employee", "salary", "promotion"]
+
+TABLE_VERSION_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS table_version_{table}_{operation.lower()} AFTER {operation} ON {table} BEGIN
+        INSERT INTO table_version (name, version) VALUES ('{table}', 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END"""
+    for table in VERSIONED_TABLES for operation in ("INSERT", "UPDATE", "DELETE")
+]
+
+
+# full-text index over employee names, an external-content FTS5 table that stores only the index;
+# rowid is the employee id and triggers keep it in sync with the employee table
+EMPLOYEE_FTS_COLUMNS = "username, firstname, lastname"
+EMPLOYEE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS employee_fts USING fts5({EMPLOYEE_FTS_COLUMNS},
+        content='employee', content_rowid='id', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_fts_insert AFTER INSERT ON employee BEGIN
+        INSERT INTO employee_fts (rowid, {EMPLOYEE_FTS_COLUMNS}) VALUES (NEW.id, NEW.username, NEW.firstname, NEW.lastname);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_fts_update AFTER UPDATE OF {EMPLOYEE_FTS_COLUMNS} ON employee BEGIN
+        INSERT INTO employee_fts (employee_fts, rowid, {EMPLOYEE_FTS_COLUMNS})
+        VALUES ('delete', OLD.id, OLD.username, OLD.firstname, OLD.lastname);
+        INSERT INTO employee_fts (rowid, {EMPLOYEE_FTS_COLUMNS}) VALUES (NEW.id, NEW.username, NEW.firstname, NEW.lastname);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_fts_delete AFTER DELETE ON employee BEGIN
+        INSERT INTO employee_fts (employee_fts, rowid, {EMPLOYEE_FTS_COLUMNS})
+        VALUES ('delete', OLD.id, OLD.username, OLD.firstname, OLD.lastname);
+    END""",
+]
+EMPLOYEE_FTS_REBUILD = "INSERT INTO employee_fts (employee_fts) VALUES ('rebuild')"
+# for queries only, the virtual table is created by EMPLOYEE_FTS_DDL
+employee_fts = table("employee_fts", column("rowid", Integer), column("employee_fts"))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_triggers(target, connection, **kw):
+    for trigger in PAYROLL_SUMMARY_TRIGGERS + TABLE_VERSION_TRIGGERS + EMPLOYEE_FTS_DDL:
+        connection.exec_driver_sql(trigger)
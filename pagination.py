@@ -0,0 +1,31 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+
+# cursors are opaque to clients: base64 of the last primary key seen on the previous page
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(data["id"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+
+
+# history pages are ordered by (received_at, id), their cursors carry both
+def encode_history_cursor(received_at: datetime, last_id: int) -> str:
+    data = json.dumps({"received_at": received_at.isoformat(), "id": last_id})
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(data["received_at"]), int(data["id"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,76 @@
+import os
+import time
+from collections import OrderedDict
+
+# authenticated employees are cached by username so protected routes skip the user lookup
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.environ.get("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenVersions:
+    # employee id -> current token version, reloaded from the database by a background task
+    def __init__(self):
+        self._versions = {}
+        # employee id -> when this worker last changed it, so a reload doesn't undo a newer change
+        self._changed_at = {}
+
+    def load(self, versions: dict, read_at: float):
+        # `read_at` is when the snapshot was read, changes made by this worker since then are kept
+        for employee_id, changed_at in self._changed_at.items():
+            if changed_at < read_at:
+                continue
+            if employee_id in self._versions:
+                versions[employee_id] = self._versions[employee_id]
+            else:
+                versions.pop(employee_id, None)
+        self._versions = versions
+        self._changed_at = {employee_id: changed_at for employee_id, changed_at in self._changed_at.items()
+                            if changed_at >= read_at}
+
+    def get(self, employee_id: int):
+        return self._versions.get(employee_id)
+
+    def set(self, employee_id: int, version: int):
+        self._versions[employee_id] = version
+        self._changed_at[employee_id] = time.monotonic()
+
+    def discard(self, employee_id: int):
+        self._versions.pop(employee_id, None)
+        self._changed_at[employee_id] = time.monotonic()
+
+
+cache = TTLCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_SIZE)
+token_versions = TokenVersions()
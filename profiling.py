@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+# opt-in per-request SQL profiling: statements are tagged with the route and request id,
+# slow statements and statements repeated within one request (N+1) are logged
+SQL_PROFILING = os.environ.get("SQL_PROFILING", "0") == "1"
+SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", 100))
+SQL_REPEATED_STATEMENT_THRESHOLD = int(os.environ.get("SQL_REPEATED_STATEMENT_THRESHOLD", 10))
+# adds an X-SQL-Profile header with the per-request breakdown, never enable it in production
+SQL_PROFILING_HEADER = os.environ.get("SQL_PROFILING_HEADER", "0") == "1"
+SQL_PROFILING_HEADER_STATEMENTS = 10
+
+logger = logging.getLogger("sql.profile")
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# unmatched requests are tagged with the raw path, which the client controls; anything that could close
+# the SQL comment or the quotes is dropped
+ROUTE_UNSAFE_CHARACTERS = re.compile(r"[^A-Za-z0-9/{}._-]")
+
+
+class RequestProfile:
+    def __init__(self, request_id: str, scope: dict):
+        self.request_id = request_id
+        self.scope = scope
+        # statement template -> [executions, total seconds]
+        self.statements = {}
+
+    @property
+    def route(self) -> str:
+        # the route is only known once the router has matched the request
+        route = self.scope.get("route")
+        return route.path if route is not None else self.scope["path"]
+
+    def record(self, statement: str, elapsed: float):
+        entry = self.statements.get(statement)
+        if entry is None:
+            entry = self.statements[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def repeated(self) -> list:
+        return [(statement, count) for statement, (count, _) in self.statements.items()
+                if count > SQL_REPEATED_STATEMENT_THRESHOLD]
+
+    def breakdown(self) -> dict:
+        statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "request_id": self.request_id,
+            "queries": sum(count for count, _ in self.statements.values()),
+            "total_ms": round(sum(elapsed for _, elapsed in self.statements.values()) * 1000, 3),
+            "statements": [{"sql": " ".join(statement.split())[:120], "count": count, "ms": round(elapsed * 1000, 3)}
+                           for statement, (count, elapsed) in statements[:SQL_PROFILING_HEADER_STATEMENTS]],
+        }
+
+
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    # types only, bound values may contain passwords and personal data
+    if executemany:
+        return f"{len(parameters)} x {parameter_shape(parameters[0])}" if parameters else "[]"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in parameters or ()) + ")"
+
+
+def _tag(statement: str, profile: RequestProfile) -> str:
+    route = ROUTE_UNSAFE_CHARACTERS.sub("", profile.route)[:200]
+    return f"{statement} /* route='{route}', request_id='{profile.request_id}' */"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    conn.info.setdefault("profiling_started", []).append((time.perf_counter(), statement))
+    if profile is None:
+        return statement, parameters
+    return _tag(statement, profile), parameters
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started, template = conn.info["profiling_started"].pop()
+    elapsed = time.perf_counter() - started
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(template, elapsed)
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        logger.warning("slow query %.1f ms route=%s request_id=%s params=%s: %s", elapsed * 1000,
+                       profile.route if profile else "", profile.request_id if profile else "",
+                       parameter_shape(parameters, executemany), " ".join(template.split()))
+
+
+def _handle_error(context):
+    # a statement that raises never reaches after_cursor_execute, its start time must not pair with the next one
+    if context.connection is not None and context.connection.info.get("profiling_started"):
+        context.connection.info["profiling_started"].pop()
+
+
+def instrument_engine(engine):
+    # engine is the sync engine, for async engines pass engine.sync_engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute, retval=True)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        profile = RequestProfile(request_id, scope)
+        token = _profile.set(profile)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                if SQL_PROFILING_HEADER:
+                    headers.append((b"x-sql-profile", json.dumps(profile.breakdown()).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _profile.reset(token)
+            for statement, count in profile.repeated():
+                logger.warning("statement ran %d times in one request route=%s request_id=%s: %s", count,
+                               profile.route, request_id, " ".join(statement.split()))
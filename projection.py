@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Union
+
+from fastapi import Response
+
+try:
+    import orjson  # optional dependency, several times faster than json for large pages
+except ImportError:
+    orjson = None
+
+# list endpoints select plain column tuples and encode them straight to JSON,
+# skipping ORM instances and per-row pydantic validation
+
+
+def parse_fields(fields: Union[str, None], allowed: List[str]) -> List[str]:
+    # ?fields=id,total selects a subset of the response fields, in the order of the schema
+    if fields is None:
+        return list(allowed)
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown or not requested:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}" if unknown else "No fields requested")
+    return [field for field in allowed if field in requested]
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+
+def dumps(fields: List[str], rows) -> bytes:
+    items = [dict(zip(fields, row)) for row in rows]
+    if orjson is not None:
+        return orjson.dumps(items, default=_default)
+    return json.dumps(items, default=_default, separators=(",", ":")).encode()
+
+
+def json_response(fields: List[str], rows, headers: dict) -> Response:
+    return Response(dumps(fields, rows), media_type="application/json", headers=headers)
@@ -0,0 +1,151 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Union
+
+import metrics
+
+# token buckets in front of /token: every attempt takes a token from the bucket of the client IP and
+# one from the bucket of the username, so bcrypt only runs while both have tokens left. A successful
+# login gives the username token back, only failures add up per username. "memory" keeps buckets in this
+# process, "store" in a shared store (LOGIN_RATE_LIMIT_URL for redis, an in-process stand-in otherwise),
+# "none" turns limiting off
+LOGIN_RATE_LIMIT_BACKEND = os.environ.get("LOGIN_RATE_LIMIT_BACKEND", "memory")
+LOGIN_RATE_LIMIT_URL = os.environ.get("LOGIN_RATE_LIMIT_URL")
+# the defaults protect a single-core server, raise the IP limits for test suites and load tests from one address
+LOGIN_RATE_LIMIT_IP_BURST = int(os.environ.get("LOGIN_RATE_LIMIT_IP_BURST", 10))
+LOGIN_RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("LOGIN_RATE_LIMIT_IP_PER_MINUTE", 20))
+LOGIN_RATE_LIMIT_USERNAME_BURST = int(os.environ.get("LOGIN_RATE_LIMIT_USERNAME_BURST", 5))
+LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE = float(os.environ.get("LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE", 5))
+# buckets kept by the memory backend, the least recently used are dropped first
+LOGIN_RATE_LIMIT_MAX_KEYS = int(os.environ.get("LOGIN_RATE_LIMIT_MAX_KEYS", 100000))
+
+rate_limited = metrics.Counter("login_rate_limited_total", "Logins rejected by the rate limiter", ("limit",))
+
+
+def take_tokens(tokens: float, updated_at: float, capacity: int, rate: float, now: float, cost: int):
+    # refills the bucket up to now and takes `cost` tokens if at least one is left, a negative cost gives
+    # tokens back. returns the new token count and how many seconds to wait for the next token, 0 when allowed
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    if cost < 0:
+        return min(capacity, tokens - cost), 0.0
+    if tokens >= 1:
+        return tokens - cost, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+# BACKENDS
+class RateLimitBackend:
+    async def take(self, key: str, capacity: int, rate: float, cost: int = 1) -> float:
+        raise NotImplementedError
+
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens, retry_after = take_tokens(tokens, updated_at, capacity, rate, now, cost)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# same as take_tokens() above, run atomically by the store; the result is a string because
+# redis truncates numbers returned from scripts to integers
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if cost < 0 then
+    tokens = math.min(capacity, tokens - cost)
+elseif tokens >= 1 then
+    tokens = tokens - cost
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class LocalStore:
+    # in-process stand-in for a shared store; evaluates TOKEN_BUCKET_SCRIPT, the only script sent to it
+    def __init__(self):
+        self._data = {}
+
+    async def eval(self, script, numkeys, key, capacity, rate, now, cost):
+        capacity, rate, now = int(capacity), float(rate), float(now)
+        tokens, updated_at = self._data.get(key, (capacity, now))
+        tokens, retry_after = take_tokens(tokens, updated_at, capacity, rate, now, int(cost))
+        self._data[key] = (tokens, now)
+        return str(retry_after)
+
+
+class StoreBackend(RateLimitBackend):
+    # buckets expire in the store once they would be full again
+    def __init__(self, client):
+        self.client = client
+
+    async def take(self, key, capacity, rate, cost=1):
+        # wall clock time, it is shared by all workers
+        return float(await self.client.eval(TOKEN_BUCKET_SCRIPT, 1, key, capacity, rate, time.time(), cost))
+
+
+def create_backend(name: str) -> Union[RateLimitBackend, None]:
+    if name == "memory":
+        return MemoryBackend(LOGIN_RATE_LIMIT_MAX_KEYS)
+    if name == "store":
+        if LOGIN_RATE_LIMIT_URL:
+            import redis.asyncio  # optional dependency, only needed for a shared limiter
+
+            return StoreBackend(redis.asyncio.from_url(LOGIN_RATE_LIMIT_URL))
+        return StoreBackend(LocalStore())
+    return None
+
+
+# LIMITER
+class LoginRateLimiter:
+    def __init__(self, backend: Union[RateLimitBackend, None], ip_burst: int, ip_per_minute: float,
+                 username_burst: int, username_per_minute: float):
+        self.backend = backend
+        self.ip_limit = (ip_burst, ip_per_minute / 60)
+        self.username_limit = (username_burst, username_per_minute / 60)
+
+    async def check(self, username: str, ip: str) -> int:
+        # call before verifying the password, returns the Retry-After in seconds, 0 when the attempt may go on.
+        # tokens are taken up front, so concurrent attempts can't all get through before the first one fails;
+        # a client blocked by IP doesn't drain the username bucket
+        if self.backend is None:
+            return 0
+        retry_after = await self.backend.take(f"login:ip:{ip}", *self.ip_limit)
+        if retry_after:
+            rate_limited.inc("ip")
+            return math.ceil(retry_after)
+        retry_after = await self.backend.take(f"login:username:{username}", *self.username_limit)
+        if retry_after:
+            rate_limited.inc("username")
+            return math.ceil(retry_after)
+        return 0
+
+    async def record_success(self, username: str):
+        if self.backend is not None:
+            await self.backend.take(f"login:username:{username}", *self.username_limit, cost=-1)
+
+
+login_limiter = LoginRateLimiter(create_backend(LOGIN_RATE_LIMIT_BACKEND),
+                                 LOGIN_RATE_LIMIT_IP_BURST, LOGIN_RATE_LIMIT_IP_PER_MINUTE,
+                                 LOGIN_RATE_LIMIT_USERNAME_BURST, LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE)
@@ -0,0 +1,247 @@
+import functools
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Union
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+import etags
+
+# "memory" keeps responses in this process, "store" uses a shared key-value store
+# (RESPONSE_CACHE_URL for redis, an in-process stand-in otherwise), "none" turns caching off.
+# A memory cache is only invalidated by writes handled by its own worker: with several uvicorn workers
+# the others serve stale bodies and 304s for up to RESPONSE_CACHE_TTL_SECONDS, use "store" with RESPONSE_CACHE_URL
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 300))
+# the number of uvicorn workers, uvicorn reads it as the default of --workers
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+logger = logging.getLogger("response_cache")
+
+# response headers that are part of a cached entry
+CACHED_HEADERS = ("ETag", "X-Next-Cursor")
+
+
+# BACKENDS
+class CacheBackend:
+    async def get(self, key: str) -> Union[bytes, None]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def incr(self, key: str, ttl: int) -> int:
+        # sets the key to a value greater than any it had before, also before it expired
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    # LRU over the total size of stored values; counters count against the size too, but they only expire:
+    # evicting one would reset a generation and bring back the entries stored under it
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        # key -> (value, expires_at), in expiry order as long as every counter gets the same ttl
+        self._counters = OrderedDict()
+        self._sequence = 0
+
+    async def get(self, key):
+        self._expire_counters()
+        if key in self._counters:
+            return str(self._counters[key][0]).encode()
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            self._pop(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl=None):
+        self._pop(key)
+        if len(value) > self.max_bytes:
+            return
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+        self.size += len(value)
+        while self.size > self.max_bytes and self._data:
+            self._pop(next(iter(self._data)))
+
+    async def delete(self, key):
+        self._pop(key)
+
+    async def incr(self, key, ttl=None):
+        self._expire_counters()
+        if self._counters.pop(key, None) is None:
+            self.size += len(key)
+        self._sequence += 1
+        self._counters[key] = (self._sequence, time.monotonic() + ttl if ttl else None)
+        return self._sequence
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= len(item[0])
+
+    def _expire_counters(self):
+        now = time.monotonic()
+        while self._counters:
+            key, (_, expires_at) = next(iter(self._counters.items()))
+            if expires_at is None or expires_at >= now:
+                return
+            del self._counters[key]
+            self.size -= len(key)
+
+
+class LocalStore:
+    # in-process stand-in for a shared store, implements the part of the redis.asyncio client used below
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, key):
+        value, expires_at = self._data.get(key, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key, value, ex=None):
+        self._data[key] = (value, time.monotonic() + ex if ex else None)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def incr(self, key):
+        value = int(await self.get(key) or 0) + 1
+        self._data[key] = (str(value).encode(), None)
+        return value
+
+
+class StoreBackend(CacheBackend):
+    # eviction is left to the store itself, e.g. redis with maxmemory-policy allkeys-lru
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key):
+        return await self.client.get(key)
+
+    async def set(self, key, value, ttl=None):
+        await self.client.set(key, value, ex=ttl)
+
+    async def delete(self, key):
+        await self.client.delete(key)
+
+    async def incr(self, key, ttl=None):
+        # values come from one shared sequence, the only key kept without a ttl
+        value = await self.client.incr("generation-sequence")
+        await self.client.set(key, value, ex=ttl)
+        return value
+
+
+def create_backend(name: str) -> Union[CacheBackend, None]:
+    if name == "memory":
+        return MemoryBackend(RESPONSE_CACHE_MAX_BYTES)
+    if name == "store":
+        if RESPONSE_CACHE_URL:
+            import redis.asyncio  # optional dependency, only needed for a shared cache
+
+            return StoreBackend(redis.asyncio.from_url(RESPONSE_CACHE_URL))
+        return StoreBackend(LocalStore())
+    return None
+
+
+def check_backend(backend: str = RESPONSE_CACHE_BACKEND, workers: int = WEB_CONCURRENCY):
+    if backend == "memory" and workers > 1:
+        logger.warning("RESPONSE_CACHE_BACKEND=memory with %d workers: a write only invalidates the cache of the "
+                       "worker that handled it, the others serve stale responses for up to %d s; "
+                       "use RESPONSE_CACHE_BACKEND=store with RESPONSE_CACHE_URL", workers, RESPONSE_CACHE_TTL_SECONDS)
+
+
+# CACHE
+class ResponseCache:
+    # entries are keyed by a per-table generation (lists) or per-row generation (single rows);
+    # invalidation bumps the generation, so a response rendered from data read before a write
+    # is stored under a key nobody asks for any more. Generations expire after the entries stored under them,
+    # a table or row that hasn't changed for a while is back to generation 0
+    def __init__(self, backend: Union[CacheBackend, None], ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.generation_ttl = 2 * ttl if ttl else None
+
+    async def _key(self, table: str, request: Request, row_id=None) -> str:
+        if row_id is None:
+            generation = int(await self.backend.get(f"generation:{table}") or 0)
+            query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+            return f"list:{table}:{generation}:{request.url.path}?{query}"
+        generation = int(await self.backend.get(f"generation:{table}:{row_id}") or 0)
+        return f"row:{table}:{row_id}:{generation}"
+
+    async def invalidate(self, table: str, row_id=None):
+        if self.backend is None:
+            return
+        await self.backend.incr(f"generation:{table}", self.generation_ttl)
+        if row_id is not None:
+            await self.backend.incr(f"generation:{table}:{row_id}", self.generation_ttl)
+
+    async def invalidate_rows(self, table: str, row_ids: list):
+        if self.backend is None or not row_ids:
+            return
+        await self.backend.incr(f"generation:{table}", self.generation_ttl)
+        for row_id in row_ids:
+            await self.backend.incr(f"generation:{table}:{row_id}", self.generation_ttl)
+
+    def cached(self, table: str, schema, id_param: Union[str, None] = None):
+        # wraps an endpoint that takes `request` and `response`, must be applied below @app.get
+        def decorator(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return await endpoint(*args, **kwargs)
+                request = kwargs["request"]
+                key = await self._key(table, request, kwargs[id_param] if id_param else None)
+                entry = await self.backend.get(key)
+                if entry is not None:
+                    return _entry_response(request, entry)
+
+                result = await endpoint(*args, **kwargs)
+                if isinstance(result, Response):
+                    # endpoints that encode their own JSON are cached as is, anything else (304s) is passed through
+                    if result.status_code != 200 or result.media_type != "application/json":
+                        return result
+                    body, source_headers = result.body, result.headers
+                else:
+                    body = JSONResponse(jsonable_encoder(parse_obj_as(schema, result))).body
+                    source_headers = kwargs["response"].headers
+                headers = {name: source_headers[name] for name in CACHED_HEADERS if name in source_headers}
+                entry = json.dumps({"headers": headers, "body": body.decode()}).encode()
+                await self.backend.set(key, entry, self.ttl)
+                return Response(body, media_type="application/json", headers=headers)
+
+            return wrapper
+
+        return decorator
+
+
+def _entry_response(request: Request, entry: bytes) -> Response:
+    entry = json.loads(entry)
+    etag = entry["headers"].get("ETag")
+    if etag is not None and etags.is_fresh(request, etag):
+        return etags.not_modified(etag)
+    return Response(entry["body"].encode(), media_type="application/json", headers=entry["headers"])
+
+
+cache = ResponseCache(create_backend(RESPONSE_CACHE_BACKEND), RESPONSE_CACHE_TTL_SECONDS)
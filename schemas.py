@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Union, Optional
+from typing import Any, List, Union, Optional
 
 from pydantic import BaseModel
 
@@ -7,6 +7,7 @@ from pydantic import BaseModel
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Union[str, None] = None
 
 
 class TokenData(BaseModel):
@@ -24,6 +25,14 @@ class EmployeeCreate(EmployeeBase):
     password: str
 
 
+class EmployeeUpdate(BaseModel):
+    username: Optional[str] = None
+    firstname: Optional[str] = None
+    lastname: Optional[str] = None
+    is_admin: Optional[bool] = None
+    password: Optional[str] = None
+
+
 class Employee(EmployeeBase):
     id: int
 
@@ -42,6 +51,13 @@ class SalaryCreate(SalaryBase):
     pass
 
 
+class SalaryUpdate(BaseModel):
+    employee_id: Optional[int] = None
+    total: Optional[float] = None
+    received_at: Optional[datetime] = None
+    is_received: Optional[bool] = None
+
+
 class Salary(SalaryBase):
     id: int
     created_at: datetime
@@ -60,9 +76,62 @@ class PromotionCreate(PromotionBase):
     pass
 
 
+class PromotionUpdate(BaseModel):
+    employee_id: Optional[int] = None
+    received_at: Optional[datetime] = None
+    is_received: Optional[bool] = None
+
+
 class Promotion(PromotionBase):
     id: int
     created_at: datetime
 
     class Config:
         orm_mode = True
+
+
+class Compensation(BaseModel):
+    employee: Employee
+    salary: Optional[Salary] = None
+    promotion: Optional[Promotion] = None
+    salary_history: List[Salary] = []
+
+
+class BulkResult(BaseModel):
+    row: int
+    id: Optional[int] = None
+    error: Any = None
+
+
+class BulkReport(BaseModel):
+    inserted: int
+    failed: int
+    results: List[BulkResult]
+
+
+class PayrollTotal(BaseModel):
+    total: float
+    salaries: int
+
+    class Config:
+        orm_mode = True
+
+
+class PayrollByEmployee(PayrollTotal):
+    employee_id: int
+
+
+class PayrollByMonth(PayrollTotal):
+    month: str
+
+
+class PayrollByStatus(PayrollTotal):
+    is_received: bool
+
+
+class UpcomingPromotions(BaseModel):
+    period: str
+    promotions: int
+
+    class Config:
+        orm_mode = True
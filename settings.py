@@ -1,23 +1,136 @@
+import os
+from functools import lru_cache
+
 import sqlalchemy as sa
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+import metrics
+import profiling
+
+# DATABASE
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///database.db")
+DB_ECHO = os.environ.get("DB_ECHO", "0") == "1"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+# SQLite pragmas applied to every new connection
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", -64000))  # negative values are KiB
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+# GET routes use a separate pool of query_only connections
+DB_READ_ONLY_CONNECTIONS = os.environ.get("DB_READ_ONLY_CONNECTIONS", "0") == "1"
+# the app lifespan applies pending migrations; disable it when migrations run as a separate step
+DB_MIGRATE_ON_STARTUP = os.environ.get("DB_MIGRATE_ON_STARTUP", "1") == "1"
+# fill a newly created database with demo employees
+SEED_DB = os.environ.get("SEED_DB", "0") == "1"
+
+
+def sqlite_pragmas(read_only: bool = False, journal_mode: str = DB_JOURNAL_MODE, synchronous: str = DB_SYNCHRONOUS,
+                   cache_size: int = DB_CACHE_SIZE, mmap_size: int = DB_MMAP_SIZE,
+                   busy_timeout: int = DB_BUSY_TIMEOUT_MS) -> list:
+    pragmas = [f"journal_mode={journal_mode}", f"synchronous={synchronous}", f"cache_size={cache_size}",
+               f"mmap_size={mmap_size}", f"busy_timeout={busy_timeout}"]
+    if read_only:
+        pragmas.append("query_only=ON")
+    return pragmas
+
+
+def _set_pragmas(engine: sa.Engine, pragmas: list):
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def create_engine(url: str = DATABASE_URL, pragmas: list = None, echo: bool = DB_ECHO) -> sa.Engine:
+    # sqlite3 connections are tied to their thread unless told otherwise, other drivers don't know the option
+    is_sqlite = sa.engine.make_url(url).get_backend_name() == "sqlite"
+    engine = sa.create_engine(url, connect_args={"check_same_thread": False} if is_sqlite else {}, echo=echo)
+    if is_sqlite:
+        _set_pragmas(engine, sqlite_pragmas() if pragmas is None else pragmas)
+    return engine
+
+
+def create_async_db_engine(url: str = DATABASE_URL, read_only: bool = False, pragmas: list = None,
+                           echo: bool = DB_ECHO, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW,
+                           pool_timeout: float = DB_POOL_TIMEOUT) -> AsyncEngine:
+    url = sa.engine.make_url(url)
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    engine = create_async_engine(url, echo=echo, pool_size=pool_size, max_overflow=max_overflow,
+                                 pool_timeout=pool_timeout,
+                                 poolclass=metrics.TimedAsyncAdaptedQueuePool if metrics.METRICS_ENABLED else None)
+    if engine.dialect.name == "sqlite":
+        _set_pragmas(engine.sync_engine, sqlite_pragmas(read_only) if pragmas is None else pragmas)
+    if metrics.METRICS_ENABLED:
+        metrics.instrument_engine(engine.sync_engine)
+    if profiling.SQL_PROFILING:
+        profiling.instrument_engine(engine.sync_engine)
+    return engine
+
+
+# engines are created on first use, so importing settings doesn't touch the database
+@lru_cache(maxsize=None)
+def get_engine() -> sa.Engine:
+    # only used to bootstrap the schema, requests go through the async engines
+    return create_engine()
+
+
+@lru_cache(maxsize=None)
+def get_async_engine() -> AsyncEngine:
+    return create_async_db_engine()
+
+
+@lru_cache(maxsize=None)
+def get_read_async_engine() -> AsyncEngine:
+    if DB_READ_ONLY_CONNECTIONS:
+        return create_async_db_engine(read_only=True)
+    return get_async_engine()
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker() -> async_sessionmaker:
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+@lru_cache(maxsize=None)
+def get_read_sessionmaker() -> async_sessionmaker:
+    if DB_READ_ONLY_CONNECTIONS:
+        return async_sessionmaker(get_read_async_engine(), autoflush=False, expire_on_commit=False)
+    return get_sessionmaker()
 
-import models
-from fill_db import fill_db
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///database.db"
+async def dispose_engines():
+    for factory in (get_read_async_engine, get_async_engine):
+        if factory.cache_info().currsize:
+            await factory().dispose()
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+    for factory in (get_read_sessionmaker, get_sessionmaker, get_read_async_engine, get_async_engine, get_engine):
+        factory.cache_clear()
 
-engine = sa.create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, echo=True
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-ins = sa.inspect(engine)
-print(len(ins.get_table_names()))
-if len(ins.get_table_names()) == 0:
-    models.Base.metadata.create_all(bind=engine)
-    fill_db(Session(engine))
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# when enabled, access tokens carry the employee id, admin flag and token version,
+# so protected routes build the current user from the token instead of the database
+JWT_CLAIMS_MODE = os.environ.get("JWT_CLAIMS_MODE", "0") == "1"
+# how often each worker reloads, in the background, the token versions used to reject revoked claims tokens
+TOKEN_VERSIONS_REFRESH_SECONDS = float(os.environ.get("TOKEN_VERSIONS_REFRESH_SECONDS", 30))
+# refresh tokens are exchanged at /token/refresh for a new access token without checking the password again
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+# how often expired refresh tokens are deleted, 0 disables the sweeper
+REFRESH_TOKEN_SWEEP_SECONDS = float(os.environ.get("REFRESH_TOKEN_SWEEP_SECONDS", 3600))
+# how often due salaries and promotions (received_at in the past) are marked received, 0 disables it
+DUE_SETTLEMENT_INTERVAL_SECONDS = float(os.environ.get("DUE_SETTLEMENT_INTERVAL_SECONDS", 60))
+# rows updated per transaction and the pause between transactions, keeps the write lock short
+DUE_SETTLEMENT_BATCH_SIZE = int(os.environ.get("DUE_SETTLEMENT_BATCH_SIZE", 500))
+DUE_SETTLEMENT_BATCH_PAUSE_SECONDS = float(os.environ.get("DUE_SETTLEMENT_BATCH_PAUSE_SECONDS", 0.01))
@@ -0,0 +1,85 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_bulk.py
+
+url = "http://localhost:8000/admin/salaries/bulk"
+
+json_rows = [
+    {"employee_id": 4, "total": 100, "received_at": "2030-01-01T00:00:00"},
+    {"employee_id": 100000, "total": 100},
+    {"employee_id": 4, "total": "not a number"},
+    {"employee_id": 4, "total": 200, "is_received": True},
+]
+ndjson_body = "\n".join([
+    '{"employee_id": 4, "total": 100}',
+    "not json",
+    '{"employee_id": 100000, "total": 100}',
+    '{"employee_id": 4, "total": 200}',
+])
+csv_body = "employee_id,total,received_at,is_received\n" \
+           "4,100,2030-01-01T00:00:00,false\n" \
+           "100000,100,,\n" \
+           "4,,,\n" \
+           "4,200,,true\n"
+
+test_data = [
+    ("username1", "password1", "application/json", json_rows),
+    ("username1", "password1", "application/x-ndjson", ndjson_body),
+    ("username1", "password1", "text/csv", csv_body),
+]
+
+
+@pytest.mark.parametrize("username,password,content_type,body", test_data)
+def test_bulk_salaries(username, password, get_token, content_type, body):
+    headers = {"Authorization": "Bearer {}".format(get_token), "Content-Type": content_type}
+    if content_type == "application/json":
+        response = requests.post(url, headers=headers, json=body)
+    else:
+        response = requests.post(url, headers=headers, data=body)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 2
+    assert report["failed"] == 2
+    assert [result["row"] for result in report["results"]] == [0, 1, 2, 3]
+    assert "id" in report["results"][0] and "id" in report["results"][3]
+    assert report["results"][1]["error"] and report["results"][2]["error"]
+
+    for result in report["results"]:
+        if "id" in result and result["id"] is not None:
+            salary = requests.get("http://localhost:8000/admin/salaries/{}".format(result["id"]), headers=headers)
+            assert salary.json()["employee_id"] == 4
+            requests.delete("http://localhost:8000/admin/salaries/{}".format(result["id"]), headers=headers)
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_bulk_unsupported_type(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token), "Content-Type": "text/plain"}
+    response = requests.post(url, headers=headers, data="employee_id")
+
+    assert response.status_code == 415
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_bulk_csv_quoted_newlines(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token), "Content-Type": "text/csv"}
+    body = 'employee_id,total,note\r\n4,300,"first line\r\nsecond line"\r\n4,400,""""\r\n'
+    response = requests.post(url, headers=headers, data=body)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 2
+    for result, total in zip(report["results"], [300, 400]):
+        salary = requests.get("http://localhost:8000/admin/salaries/{}".format(result["id"]), headers=headers)
+        assert salary.json()["total"] == total
+        requests.delete("http://localhost:8000/admin/salaries/{}".format(result["id"]), headers=headers)
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_bulk_invalid_encoding(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token), "Content-Type": "text/csv"}
+    response = requests.post(url, headers=headers, data="employee_id,total\n4,\xff\n".encode("latin-1"))
+
+    assert response.status_code == 400
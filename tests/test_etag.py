@@ -0,0 +1,60 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_etag.py
+
+base_url = "http://localhost:8000"
+
+test_data = [
+    ("username2", "password2", "/users/me/salary/"),
+    ("username2", "password2", "/users/me/promotion/"),
+    ("username1", "password1", "/admin/employees/"),
+    ("username1", "password1", "/admin/employees/2"),
+    ("username1", "password1", "/admin/salaries/"),
+    ("username1", "password1", "/admin/salaries/1"),
+    ("username1", "password1", "/admin/promotions/"),
+    ("username1", "password1", "/promotions/1"),
+]
+
+
+@pytest.mark.parametrize("username,password,path", test_data)
+def test_not_modified(username, password, get_token, path):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    response = requests.get(base_url + path, headers=headers)
+
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    headers["If-None-Match"] = etag
+    response = requests.get(base_url + path, headers=headers)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    headers["If-None-Match"] = '"stale", W/' + etag
+    response = requests.get(base_url + path, headers=headers)
+    assert response.status_code == 304
+
+    headers["If-None-Match"] = '"stale"'
+    response = requests.get(base_url + path, headers=headers)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_etag_changes_on_write(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    list_etag = requests.get(base_url + "/admin/salaries/", headers=headers).headers["ETag"]
+
+    salary = requests.post(base_url + "/admin/salaries/", headers=headers, json={"employee_id": 4, "total": 1}).json()
+    item_url = base_url + "/admin/salaries/{}".format(salary["id"])
+    item_etag = requests.get(item_url, headers=headers).headers["ETag"]
+    requests.put(item_url, headers=headers, json={"employee_id": 4, "total": 2})
+
+    list_response = requests.get(base_url + "/admin/salaries/", headers={**headers, "If-None-Match": list_etag})
+    item_response = requests.get(item_url, headers={**headers, "If-None-Match": item_etag})
+    requests.delete(item_url, headers=headers)
+
+    assert list_response.status_code == 200
+    assert item_response.status_code == 200
+    assert item_response.json()["total"] == 2
@@ -0,0 +1,45 @@
+import csv
+import io
+import json
+
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_export.py
+
+url = "http://localhost:8000/admin/salaries/export"
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_export_ndjson(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    expected = requests.get("http://localhost:8000/admin/salaries/", headers=headers, params={"limit": 1000}).json()
+
+    response = requests.get(url, headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == expected
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_export_csv_filtered(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+
+    response = requests.get(url, headers=headers, params={"format": "csv", "employee_id": 3})
+
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows
+    assert all(row["employee_id"] == "3" for row in rows)
+    assert set(rows[0]) == {"id", "employee_id", "total", "created_at", "received_at", "is_received"}
+
+
+@pytest.mark.parametrize("username,password", [("username2", "password2")])
+def test_export_forbidden(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    response = requests.get(url, headers=headers)
+
+    assert response.status_code == 403
@@ -0,0 +1,33 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_fields.py
+
+base_url = "http://localhost:8000"
+
+test_data = [
+    ("/admin/employees/", "id,username", ["username", "id"]),
+    ("/admin/salaries/", "total", ["total"]),
+    ("/admin/promotions/", "employee_id,received_at", ["employee_id", "received_at"]),
+]
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+@pytest.mark.parametrize("path,fields,expected_fields", test_data)
+def test_sparse_fields(username, password, get_token, path, fields, expected_fields):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    response = requests.get(base_url + path, headers=headers, params={"fields": fields, "limit": 1})
+
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert list(response.json()[0]) == expected_fields
+    # the cursor is still produced when id is not among the requested fields
+    assert "X-Next-Cursor" in response.headers
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_unknown_fields(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    response = requests.get(base_url + "/admin/employees/", headers=headers, params={"fields": "password"})
+    assert response.status_code == 400
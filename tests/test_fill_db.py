@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+import pytest
+
+import fill_db
+import migrations
+
+# RUN TEST
+# pytest test_fill_db.py
+
+distribution = fill_db.Distribution(employees=200, salaries_per_employee=12, promotion_rate=0.5)
+today = datetime(2024, 6, 15)
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    migrations.upgrade(engine)
+    yield engine
+    engine.dispose()
+
+
+def dump(engine):
+    # everything but the password hash, which gets a random salt
+    with engine.connect() as connection:
+        return [connection.execute(sa.text("SELECT id, username, firstname, lastname, is_admin FROM employee")).all()] + \
+            [connection.execute(sa.text(f"SELECT * FROM {table} ORDER BY 1, 2, 3")).all()
+             for table in ("salary", "promotion", "payroll_summary")]
+
+
+def test_generate_is_deterministic(engine, tmp_path):
+    counts = fill_db.generate(engine, distribution, seed=7, today=today, batch_size=500)
+    assert counts["employee"] == 200
+    assert counts["salary"] == 200 * 12
+
+    other = sa.create_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    migrations.upgrade(other)
+    fill_db.generate(other, distribution, seed=7, today=today, batch_size=500)
+    assert dump(engine) == dump(other)
+    other.dispose()
+
+
+def test_generate_does_not_reuse_deleted_ids(engine):
+    small = fill_db.Distribution(employees=3, salaries_per_employee=1)
+    fill_db.generate(engine, small, today=today)
+    with engine.begin() as connection:
+        connection.execute(sa.text("DELETE FROM employee WHERE id = 3"))
+    fill_db.generate(engine, small, today=today)
+
+    with engine.begin() as connection:
+        assert connection.execute(sa.text("SELECT id FROM employee ORDER BY id")).scalars().all() == [1, 2, 4, 5, 6]
+        connection.execute(sa.text("INSERT INTO employee (username) VALUES ('next')"))
+        assert connection.execute(sa.text("SELECT id FROM employee WHERE username = 'next'")).scalar() == 7
+
+
+def test_generate_keeps_derived_tables_in_sync(engine):
+    fill_db.generate(engine, distribution, seed=1, today=today)
+    fill_db.generate(engine, distribution, seed=2, today=today)
+
+    with engine.begin() as connection:
+        assert connection.execute(sa.text("SELECT COUNT(*) FROM employee")).scalar() == 400
+        summary = connection.execute(sa.text("SELECT SUM(salaries), SUM(total) FROM payroll_summary")).one()
+        salaries = connection.execute(sa.text("SELECT COUNT(*), SUM(total) FROM salary")).one()
+        assert summary[0] == salaries[0]
+        assert summary[1] == pytest.approx(salaries[1])
+
+        # the triggers are back in place after the load
+        connection.execute(sa.text("INSERT INTO salary (employee_id, total, received_at, is_received) "
+                                   "VALUES (1, 100, '2024-06-01 00:00:00.000000', 1)"))
+        assert connection.execute(sa.text("SELECT SUM(salaries) FROM payroll_summary")).scalar() == salaries[0] + 1
+        plan = connection.execute(sa.text(
+            "EXPLAIN QUERY PLAN SELECT * FROM salary WHERE employee_id = 1 ORDER BY id DESC LIMIT 1")).all()
+        assert "USING INDEX ix_salary_employee_id_id" in plan[0][-1]
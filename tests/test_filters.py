@@ -0,0 +1,95 @@
+import re
+from datetime import datetime
+
+import sqlalchemy as sa
+import pytest
+import requests
+
+import crud
+import fill_db
+import migrations
+import models
+
+# RUN TEST
+# pytest test_filters.py
+
+base_url = "http://localhost:8000"
+
+week = dict(received_from=datetime(2024, 6, 10), received_to=datetime(2024, 6, 17))
+full_scan = re.compile(r"SCAN (employee|salary|promotion)\b")
+
+plan_data = [
+    (models.Salary, crud.received_filters(models.Salary, employee_id=42)),
+    (models.Salary, crud.received_filters(models.Salary, employee_id=42, is_received=False, **week)),
+    (models.Salary, crud.received_filters(models.Salary, is_received=False, **week)),
+    (models.Salary, crud.received_filters(models.Salary, **week)),
+    (models.Salary, crud.total_filters(total_min=1000, total_max=1500)),
+    (models.Promotion, crud.received_filters(models.Promotion, employee_id=42)),
+    (models.Promotion, crud.received_filters(models.Promotion, is_received=False, **week)),
+    (models.Promotion, crud.received_filters(models.Promotion, **week)),
+    (models.Employee, crud.employee_search_filters("Petrov")),
+    (models.Employee, crud.employee_search_filters("iva pet")),
+]
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    engine = sa.create_engine(f"sqlite:///{tmp_path_factory.mktemp('filters') / 'test.db'}")
+    migrations.upgrade(engine)
+    fill_db.generate(engine, fill_db.Distribution(employees=300, salaries_per_employee=12), seed=1,
+                     today=datetime(2024, 6, 15))
+    yield engine
+    engine.dispose()
+
+
+def query_plan(engine, query) -> str:
+    compiled = query.compile(dialect=engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [str(param) if isinstance(param, datetime) else param for param in params]
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), tuple(params)).all()
+    return " | ".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize("model,where", plan_data)
+@pytest.mark.parametrize("after_id", [None, 100])
+def test_filters_use_indexes(engine, model, where, after_id):
+    plan = query_plan(engine, crud.select_rows(model, ["id"], after_id=after_id, where=where))
+    assert not full_scan.search(plan), plan
+
+
+def test_employee_search(engine):
+    with engine.begin() as connection:
+        connection.execute(sa.text("INSERT INTO employee (id, username, firstname, lastname) "
+                                   "VALUES (10000, 'search1', 'Варвара', 'Петрова')"))
+        rows = connection.execute(crud.select_rows(models.Employee, ["id"],
+                                                   where=crud.employee_search_filters("вар пЕт"))).all()
+        assert rows == [(10000,)]
+
+        connection.execute(sa.text("UPDATE employee SET lastname = 'Сидорова' WHERE id = 10000"))
+        assert connection.execute(crud.select_rows(models.Employee, ["id"],
+                                                   where=crud.employee_search_filters("Петрова"))).all() == []
+        connection.execute(sa.text("DELETE FROM employee WHERE id = 10000"))
+        assert connection.execute(crud.select_rows(models.Employee, ["id"],
+                                                   where=crud.employee_search_filters("Сидорова"))).all() == []
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_filter_endpoints(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+
+    response = requests.get(base_url + "/admin/employees/", headers=headers, params={"q": "petr"})
+    assert [employee["username"] for employee in response.json()] == ["username2"]
+
+    response = requests.get(base_url + "/admin/salaries/", headers=headers, params={"employee_id": 3})
+    assert response.status_code == 200
+    assert response.json() and all(salary["employee_id"] == 3 for salary in response.json())
+
+    response = requests.get(base_url + "/admin/salaries/", headers=headers, params={"total_min": 1000,
+                                                                                    "is_received": False})
+    assert response.json() and all(salary["total"] >= 1000 and not salary["is_received"]
+                                   for salary in response.json())
+
+    response = requests.get(base_url + "/admin/promotions/", headers=headers,
+                            params={"received_from": "2000-01-01T00:00:00", "received_to": "2000-01-02T00:00:00"})
+    assert response.json() == []
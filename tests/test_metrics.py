@@ -0,0 +1,61 @@
+import requests
+import pytest
+import sqlalchemy as sa
+
+import metrics
+
+# RUN TEST
+# pytest test_metrics.py
+
+url = "http://localhost:8000/metrics"
+me_url = "http://localhost:8000/users/me/salary/"
+
+
+def test_histogram_render():
+    histogram = metrics.Histogram("test_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    metrics.registry.remove(histogram)
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    lines = histogram.render().splitlines()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+
+
+def test_failed_statement_leaves_no_start_time():
+    engine = sa.create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    with engine.connect() as connection:
+        with pytest.raises(sa.exc.OperationalError):
+            connection.execute(sa.text("SELECT * FROM missing"))
+        connection.execute(sa.text("SELECT 1"))
+        assert connection.info["metrics_started"] == []
+    engine.dispose()
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_handled_errors_keep_their_status(username, password, get_token):
+    response = requests.post("http://localhost:8000/admin/salaries/",
+                             headers={"Authorization": "Bearer {}".format(get_token)}, json={"total": "lots"})
+    assert response.status_code == 422
+    text = requests.get(url).text
+    assert 'http_request_duration_seconds_count{method="POST",route="/admin/salaries/",status="422"}' in text
+
+
+@pytest.mark.parametrize("username,password", [("username2", "password2")])
+def test_metrics(username, password, get_token):
+    response = requests.get(me_url, headers={"Authorization": "Bearer {}".format(get_token)})
+    assert response.status_code == 200
+
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/users/me/salary/",status="200"}' in text
+    assert 'db_queries_per_request_count{method="GET",route="/users/me/salary/"}' in text
+    assert 'db_query_duration_seconds_count{route="/users/me/salary/"}' in text
+    assert "db_connection_wait_seconds_count" in text
+    assert "password_hash_duration_seconds_count" in text
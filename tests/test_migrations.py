@@ -0,0 +1,67 @@
+import sqlalchemy as sa
+import pytest
+
+import migrations
+
+# RUN TEST
+# pytest test_migrations.py
+
+# schema of databases created before migrations were introduced
+legacy_schema = [
+    "CREATE TABLE employee (id INTEGER NOT NULL, username VARCHAR(128), password VARCHAR(128), "
+    "firstname VARCHAR(128), lastname VARCHAR(128), is_admin BOOLEAN, PRIMARY KEY (id), UNIQUE (username))",
+    "CREATE TABLE salary (id INTEGER NOT NULL, employee_id INTEGER, total NUMERIC, created_at DATETIME, "
+    "received_at DATETIME, is_received BOOLEAN, PRIMARY KEY (id), FOREIGN KEY(employee_id) REFERENCES employee (id))",
+    "CREATE TABLE promotion (id INTEGER NOT NULL, employee_id INTEGER, created_at DATETIME, "
+    "received_at DATETIME, is_received BOOLEAN, PRIMARY KEY (id), FOREIGN KEY(employee_id) REFERENCES employee (id))",
+]
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_creates_schema(engine):
+    assert migrations.upgrade(engine) is True
+    assert migrations.upgrade(engine) is False
+
+    with engine.connect() as connection:
+        assert migrations.get_version(connection) == migrations.LATEST_VERSION
+
+
+def test_upgrade_legacy_database(engine):
+    with engine.begin() as connection:
+        for statement in legacy_schema:
+            connection.execute(sa.text(statement))
+        connection.execute(sa.text("INSERT INTO employee (id, username) VALUES (1, 'username1')"))
+
+    assert migrations.upgrade(engine) is False
+
+    with engine.connect() as connection:
+        assert migrations.get_version(connection) == migrations.LATEST_VERSION
+        assert connection.execute(sa.text("SELECT token_version FROM employee")).scalar() == 0
+        plan = connection.execute(sa.text(
+            "EXPLAIN QUERY PLAN SELECT * FROM salary WHERE employee_id = 1 ORDER BY id DESC LIMIT 1")).all()
+        assert "USING INDEX ix_salary_employee_id_id" in plan[0][-1]
+
+
+def test_employee_ids_are_not_reused(engine):
+    with engine.begin() as connection:
+        for statement in legacy_schema:
+            connection.execute(sa.text(statement))
+        connection.execute(sa.text("INSERT INTO employee (id, username) VALUES (1, 'username1'), (2, 'username2')"))
+
+    migrations.upgrade(engine)
+
+    with engine.begin() as connection:
+        connection.execute(sa.text("DELETE FROM employee WHERE id = 2"))
+        connection.execute(sa.text("INSERT INTO employee (username) VALUES ('username3')"))
+        assert connection.execute(sa.text("SELECT id FROM employee WHERE username = 'username3'")).scalar() == 3
+        # the rebuilt table still has its index and search triggers
+        assert connection.execute(sa.text(
+            "SELECT rowid FROM employee_fts WHERE employee_fts MATCH 'username3'")).scalar() == 3
+        assert connection.execute(sa.text(
+            "SELECT count(*) FROM sqlite_master WHERE name = 'ix_employee_id'")).scalar() == 1
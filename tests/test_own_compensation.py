@@ -0,0 +1,49 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_own_compensation.py
+# RUN TEST WITH OUTPUT
+# pytest test_own_compensation.py -s
+
+url = "http://localhost:8000/users/me/compensation/"
+
+test_data = [
+    ("username1", "password1", 200),
+    ("username3", "password3", 200),
+    ("charlie", "password3", 401),
+    ("", "", 401)
+]
+
+
+@pytest.mark.parametrize("username,password,expected_status_code", test_data)
+def test_get_compensation(username, password, get_token, expected_status_code):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    response = requests.get(url, headers=headers, params={"history": 10})
+
+    print(response.status_code)
+    print(response.json())
+
+    assert response.status_code == expected_status_code
+    if response.status_code == 200:
+        compensation = response.json()
+        assert compensation["employee"]["username"] == username
+        salary = requests.get("http://localhost:8000/users/me/salary/", headers=headers)
+        promotion = requests.get("http://localhost:8000/users/me/promotion/", headers=headers)
+        assert compensation["salary"] == (salary.json() if salary.status_code == 200 else None)
+        assert compensation["promotion"] == (promotion.json() if promotion.status_code == 200 else None)
+        history = compensation["salary_history"]
+        assert [s["id"] for s in history] == sorted([s["id"] for s in history], reverse=True)
+        if history:
+            assert history[0] == compensation["salary"]
+
+
+@pytest.mark.parametrize("username,password", [("username3", "password3")])
+def test_history_size(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+
+    without_history = requests.get(url, headers=headers).json()
+    one = requests.get(url, headers=headers, params={"history": 1}).json()
+
+    assert without_history["salary_history"] == []
+    assert len(one["salary_history"]) == 1
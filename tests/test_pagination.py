@@ -0,0 +1,39 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_pagination.py
+
+url = "http://localhost:8000/admin/salaries/"
+
+test_data = [
+    ("username1", "password1", 2),
+    ("username1", "password1", 3),
+]
+
+
+@pytest.mark.parametrize("username,password,limit", test_data)
+def test_cursor_pages(username, password, get_token, limit):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    expected = requests.get(url, headers=headers, params={"limit": 1000}).json()
+
+    ids = []
+    params = {"limit": limit}
+    while True:
+        response = requests.get(url, headers=headers, params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= limit
+        ids += [salary["id"] for salary in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": limit, "cursor": response.headers["X-Next-Cursor"]}
+
+    assert ids == [salary["id"] for salary in expected]
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_invalid_cursor(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    response = requests.get(url, headers=headers, params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
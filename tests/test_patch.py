@@ -0,0 +1,74 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_patch.py
+
+base_url = "http://localhost:8000"
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_patch_salary(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    salary = requests.post(base_url + "/admin/salaries/", headers=headers,
+                           json={"employee_id": 4, "total": 100, "received_at": "2030-01-15T00:00:00"}).json()
+    item_url = base_url + "/admin/salaries/{}".format(salary["id"])
+
+    response = requests.patch(item_url, headers=headers, json={"is_received": True})
+    assert response.status_code == 200
+    assert response.json()["is_received"] is True
+    assert response.json()["total"] == 100
+    assert response.json()["received_at"] == "2030-01-15T00:00:00"
+
+    response = requests.patch(item_url, headers=headers, json={"total": 150})
+    assert response.json()["total"] == 150
+    assert response.json()["is_received"] is True
+    assert requests.get(item_url, headers=headers).json()["total"] == 150
+
+    response = requests.delete(item_url, headers=headers)
+    assert response.status_code == 200
+    assert requests.patch(item_url, headers=headers, json={"total": 1}).status_code == 404
+    assert requests.delete(item_url, headers=headers).status_code == 404
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_patch_promotion(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    promotion = requests.post(base_url + "/promotions/", headers=headers,
+                              json={"employee_id": 4, "received_at": "2030-01-15T00:00:00"}).json()
+    item_url = base_url + "/promotions/{}".format(promotion["id"])
+
+    response = requests.patch(item_url, headers=headers, json={"received_at": "2030-02-01T00:00:00"})
+    assert response.status_code == 200
+    assert response.json()["received_at"] == "2030-02-01T00:00:00"
+    assert response.json()["employee_id"] == 4
+
+    assert requests.delete(item_url, headers=headers).status_code == 200
+    assert requests.patch(item_url, headers=headers, json={"is_received": True}).status_code == 404
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_patch_employee(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    employee = requests.post(base_url + "/admin/employees/", headers=headers,
+                             json={"username": "patched", "password": "secret", "firstname": "Olga"}).json()
+    item_url = base_url + "/admin/employees/{}".format(employee["id"])
+    token = requests.post(base_url + "/token", data={"username": "patched", "password": "secret"}).json()
+    own_headers = {"Authorization": "Bearer {}".format(token["access_token"])}
+    assert requests.get(base_url + "/users/me/", headers=own_headers).status_code == 200
+
+    response = requests.patch(item_url, headers=headers, json={"lastname": "Ivanova"})
+    assert response.status_code == 200
+    assert response.json()["firstname"] == "Olga"
+    assert response.json()["lastname"] == "Ivanova"
+
+    response = requests.patch(item_url, headers=headers, json={"username": "username2"})
+    assert response.status_code == 400
+
+    response = requests.patch(item_url, headers=headers, json={"username": "patched2"})
+    assert response.json()["username"] == "patched2"
+    # the token was issued for the old username
+    assert requests.get(base_url + "/users/me/", headers=own_headers).status_code == 401
+
+    assert requests.delete(item_url, headers=headers).status_code == 200
+    assert requests.patch(item_url, headers=headers, json={"lastname": "Petrova"}).status_code == 404
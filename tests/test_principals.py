@@ -0,0 +1,20 @@
+import time
+
+import principals
+
+# RUN TEST
+# pytest test_principals.py
+
+
+def test_reload_keeps_newer_changes():
+    versions = principals.TokenVersions()
+    read_at = time.monotonic()
+    # changed by this worker while the snapshot was being read
+    versions.set(1, 5)
+    versions.discard(2)
+    versions.load({1: 4, 2: 0, 3: 0}, read_at)
+    assert (versions.get(1), versions.get(2), versions.get(3)) == (5, None, 0)
+
+    # a later snapshot wins
+    versions.load({1: 6, 2: 1}, time.monotonic())
+    assert (versions.get(1), versions.get(2), versions.get(3)) == (6, 1, None)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import profiling
+
+# RUN TEST
+# pytest test_profiling.py
+
+
+def test_parameter_shape():
+    assert profiling.parameter_shape((1, "a", None)) == "(int, str, NoneType)"
+    assert profiling.parameter_shape({"id": 1}) == "{id: int}"
+    assert profiling.parameter_shape([(1, 2.5), (2, 3.5)], executemany=True) == "2 x (int, float)"
+
+
+def test_tag_sanitizes_route():
+    profile = profiling.RequestProfile("request-1", {"path": "/x**//'; DROP TABLE employee; --", "route": None})
+    tagged = profiling._tag("SELECT 1", profile)
+    assert tagged == "SELECT 1 /* route='/x//DROPTABLEemployee--', request_id='request-1' */"
+
+
+def test_request_profile(monkeypatch):
+    monkeypatch.setattr(profiling, "SQL_REPEATED_STATEMENT_THRESHOLD", 2)
+    engine = create_async_engine("sqlite+aiosqlite://")
+    profiling.instrument_engine(engine.sync_engine)
+    profile = profiling.RequestProfile("request-1", {"path": "/employees/1", "route": None})
+
+    async def scenario():
+        token = profiling._profile.set(profile)
+        try:
+            async with engine.connect() as connection:
+                await connection.execute(sa.text("CREATE TABLE employee (id INTEGER)"))
+                for employee_id in range(3):
+                    await connection.execute(sa.text("SELECT id FROM employee WHERE id = :id"), {"id": employee_id})
+        finally:
+            profiling._profile.reset(token)
+        await engine.dispose()
+
+    asyncio.run(scenario())
+    assert profile.repeated() == [("SELECT id FROM employee WHERE id = ?", 3)]
+    breakdown = profile.breakdown()
+    assert breakdown["request_id"] == "request-1"
+    assert breakdown["queries"] == 4
+    assert breakdown["statements"][0]["sql"] in ("CREATE TABLE employee (id INTEGER)",
+                                                 "SELECT id FROM employee WHERE id = ?")
+
+
+def test_failed_statement_leaves_no_start_time():
+    engine = sa.create_engine("sqlite://")
+    profiling.instrument_engine(engine)
+    with engine.connect() as connection:
+        with pytest.raises(sa.exc.OperationalError):
+            connection.execute(sa.text("SELECT * FROM missing"))
+        connection.execute(sa.text("SELECT 1"))
+        assert connection.info["profiling_started"] == []
+    engine.dispose()
@@ -0,0 +1,61 @@
+import asyncio
+import uuid
+
+import pytest
+import requests
+
+import rate_limit
+
+# RUN TEST
+# pytest test_rate_limit.py
+
+url = "http://localhost:8000/token"
+
+
+def test_take_tokens_refills_over_time():
+    assert rate_limit.take_tokens(0, 0, 5, 1, 2.5, 1) == (1.5, 0.0)
+    assert rate_limit.take_tokens(3, 0, 5, 1, 100, 1) == (4, 0.0)
+    tokens, retry_after = rate_limit.take_tokens(0, 0, 5, 0.5, 1, 1)
+    assert tokens == 0.5 and retry_after == 1
+    # a negative cost gives tokens back, up to the capacity
+    assert rate_limit.take_tokens(0, 0, 5, 1, 0, -1) == (1, 0.0)
+    assert rate_limit.take_tokens(5, 0, 5, 1, 0, -1) == (5, 0.0)
+
+
+@pytest.mark.parametrize("backend", [rate_limit.MemoryBackend(1000), rate_limit.StoreBackend(rate_limit.LocalStore())])
+def test_limiter(backend):
+    limiter = rate_limit.LoginRateLimiter(backend, ip_burst=6, ip_per_minute=1,
+                                          username_burst=2, username_per_minute=1)
+
+    async def run():
+        # successful logins give the username token back
+        for _ in range(3):
+            assert await limiter.check("alice", "10.0.0.1") == 0
+            await limiter.record_success("alice")
+        assert await limiter.check("alice", "10.0.0.1") == 0
+        assert await limiter.check("alice", "10.0.0.1") == 0
+        assert await limiter.check("alice", "10.0.0.1") == 60
+        assert await limiter.check("bob", "10.0.0.2") == 0
+        # the IP bucket is empty now, whatever the username
+        assert await limiter.check("bob", "10.0.0.1") == 60
+
+    asyncio.run(run())
+
+
+def test_limiter_disabled():
+    limiter = rate_limit.LoginRateLimiter(None, 1, 1, 1, 1)
+    assert asyncio.run(limiter.check("alice", "10.0.0.1")) == 0
+
+
+def test_failed_logins_are_limited():
+    # a username of its own, the server keeps the bucket between runs
+    data = {"grant_type": "password", "username": "typo-{}".format(uuid.uuid4().hex), "password": "wrong"}
+    statuses = [requests.post(url, data=data).status_code for _ in range(rate_limit.LOGIN_RATE_LIMIT_USERNAME_BURST)]
+    assert statuses == [401] * rate_limit.LOGIN_RATE_LIMIT_USERNAME_BURST
+
+    response = requests.post(url, data=data)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # other usernames are not affected
+    assert requests.post(url, data={"grant_type": "password", "username": "username2",
+                                    "password": "password2"}).status_code == 200
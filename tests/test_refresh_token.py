@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+import migrations
+import models
+import settings
+
+# RUN TEST
+# pytest test_refresh_token.py
+
+base_url = "http://localhost:8000"
+
+
+def login(username, password, device=None):
+    data = {"username": username, "password": password}
+    if device is not None:
+        data["client_id"] = device
+    return requests.post(base_url + "/token", data=data).json()
+
+
+def refresh(refresh_token):
+    return requests.post(base_url + "/token/refresh", data={"refresh_token": refresh_token})
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1"), ("username2", "password2")])
+def test_refresh_rotates_token(username, password):
+    tokens = login(username, password)
+    assert tokens["refresh_token"]
+
+    response = refresh(tokens["refresh_token"])
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    me = requests.get(base_url + "/users/me/", headers={"Authorization": "Bearer " + refreshed["access_token"]})
+    assert me.json()["username"] == username
+
+    # each refresh token can be exchanged once
+    assert refresh(tokens["refresh_token"]).status_code == 401
+    assert refresh(refreshed["refresh_token"]).status_code == 200
+
+
+def test_refresh_unknown_token():
+    assert refresh("not-a-token").status_code == 401
+
+
+def test_revoke_token():
+    tokens = login("username2", "password2")
+    assert requests.post(base_url + "/token/revoke", data={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    assert refresh(tokens["refresh_token"]).status_code == 401
+
+
+@pytest.mark.parametrize("username,password", [("username2", "password2")])
+def test_revoke_own_tokens_per_device(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    laptop = login(username, password, "laptop")
+    phone = login(username, password, "phone")
+
+    response = requests.delete(base_url + "/users/me/refresh-tokens", params={"device": "laptop"}, headers=headers)
+    assert response.json()["revoked"] >= 1
+    assert refresh(laptop["refresh_token"]).status_code == 401
+    # the rotated token stays on the same device
+    phone = refresh(phone["refresh_token"]).json()
+
+    requests.delete(base_url + "/users/me/refresh-tokens", headers=headers)
+    assert refresh(phone["refresh_token"]).status_code == 401
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_admin_revokes_and_employee_update_invalidates(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    employee = requests.post(base_url + "/admin/employees/", headers=headers,
+                             json={"username": "refreshed", "password": "secret"}).json()
+    item_url = base_url + "/admin/employees/{}".format(employee["id"])
+
+    tokens = login("refreshed", "secret", "tablet")
+    response = requests.delete(item_url + "/refresh-tokens", params={"device": "tablet"}, headers=headers)
+    assert response.json() == {"revoked": 1}
+    assert refresh(tokens["refresh_token"]).status_code == 401
+
+    # a name fix keeps the employee signed in, a new password doesn't
+    tokens = login("refreshed", "secret")
+    requests.patch(item_url, headers=headers, json={"firstname": "Anna"})
+    tokens = refresh(tokens["refresh_token"]).json()
+    me = requests.get(base_url + "/users/me/", headers={"Authorization": "Bearer {}".format(tokens["access_token"])})
+    assert me.json()["firstname"] == "Anna"
+    requests.patch(item_url, headers=headers, json={"password": "secret2"})
+    assert refresh(tokens["refresh_token"]).status_code == 401
+
+    assert requests.delete(item_url, headers=headers).status_code == 200
+
+
+def test_sweeper_deletes_expired_tokens(tmp_path):
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    migrations.upgrade(settings.create_engine(url, echo=False))
+
+    async def run():
+        engine = settings.create_async_db_engine(url, echo=False)
+        async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+            employee = models.Employee(username="user", password="", token_version=0)
+            db.add(employee)
+            await db.commit()
+            now = datetime.utcnow()
+            for days in range(-5, 5):
+                await crud.create_refresh_token(db, employee, "", now + timedelta(days=days, minutes=1))
+            assert await crud.delete_expired_refresh_tokens(db, now, batch_size=2) == 5
+            assert await crud.delete_expired_refresh_tokens(db, now) == 0
+        await engine.dispose()
+
+    asyncio.run(run())
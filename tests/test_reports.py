@@ -0,0 +1,70 @@
+import requests
+import pytest
+
+# RUN TEST
+# pytest test_reports.py
+
+url = "http://localhost:8000/admin/reports/"
+
+
+def salaries(headers):
+    return requests.get("http://localhost:8000/admin/salaries/", headers=headers, params={"limit": 1000}).json()
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_payroll_by_employee(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    expected = {}
+    for salary in salaries(headers):
+        expected[salary["employee_id"]] = expected.get(salary["employee_id"], 0) + salary["total"]
+
+    response = requests.get(url + "payroll/by-employee", headers=headers)
+
+    assert response.status_code == 200
+    assert {row["employee_id"]: row["total"] for row in response.json()} == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_payroll_by_month_and_status(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    total = sum(salary["total"] for salary in salaries(headers))
+
+    by_month = requests.get(url + "payroll/by-month", headers=headers)
+    by_status = requests.get(url + "payroll/by-status", headers=headers)
+
+    assert by_month.status_code == 200
+    assert by_status.status_code == 200
+    assert sum(row["total"] for row in by_month.json()) == pytest.approx(total)
+    assert sum(row["total"] for row in by_status.json()) == pytest.approx(total)
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_payroll_follows_salary_changes(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    params = {"employee_id": 4}
+    before = requests.get(url + "payroll/by-employee", headers=headers, params=params).json()
+    before = before[0]["total"] if before else 0
+
+    salary = requests.post("http://localhost:8000/admin/salaries/", headers=headers,
+                           json={"employee_id": 4, "total": 250}).json()
+    created = requests.get(url + "payroll/by-employee", headers=headers, params=params).json()
+    requests.put("http://localhost:8000/admin/salaries/{}".format(salary["id"]), headers=headers,
+                 json={"employee_id": 4, "total": 100})
+    updated = requests.get(url + "payroll/by-employee", headers=headers, params=params).json()
+    requests.delete("http://localhost:8000/admin/salaries/{}".format(salary["id"]), headers=headers)
+    deleted = requests.get(url + "payroll/by-employee", headers=headers, params=params).json()
+
+    assert created[0]["total"] == pytest.approx(before + 250)
+    assert updated[0]["total"] == pytest.approx(before + 100)
+    assert (deleted[0]["total"] if deleted else 0) == pytest.approx(before)
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_upcoming_promotions(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+
+    response = requests.get(url + "promotions/upcoming", headers=headers, params={"period": "week"})
+
+    assert response.status_code == 200
+    for row in response.json():
+        assert row["promotions"] > 0
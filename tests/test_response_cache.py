@@ -0,0 +1,96 @@
+import asyncio
+
+import requests
+import pytest
+
+import response_cache
+
+# RUN TEST
+# pytest test_response_cache.py
+
+backends = [
+    response_cache.MemoryBackend(max_bytes=1024),
+    response_cache.StoreBackend(response_cache.LocalStore()),
+]
+
+
+@pytest.mark.parametrize("backend", backends)
+def test_backend(backend):
+    async def scenario():
+        assert await backend.get("missing") is None
+        await backend.set("key", b"value", 60)
+        assert await backend.get("key") == b"value"
+        await backend.delete("key")
+        assert await backend.get("key") is None
+        assert await backend.incr("counter") == 1
+        assert await backend.incr("counter") == 2
+        assert int(await backend.get("counter")) == 2
+
+    asyncio.run(scenario())
+
+
+def test_memory_backend_evicts_least_recently_used():
+    async def scenario():
+        backend = response_cache.MemoryBackend(max_bytes=10)
+        await backend.set("a", b"12345", None)
+        await backend.set("b", b"12345", None)
+        await backend.get("a")
+        await backend.set("c", b"12345", None)
+        assert backend.size <= 10
+        assert await backend.get("a") == b"12345"
+        assert await backend.get("b") is None
+        assert await backend.get("c") == b"12345"
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("backend", [
+    response_cache.MemoryBackend(max_bytes=1024),
+    response_cache.StoreBackend(response_cache.LocalStore()),
+])
+def test_generations_expire_without_repeating(backend):
+    async def scenario():
+        first = await backend.incr("generation:salary:1", 0.05)
+        assert await backend.incr("generation:salary:2", 0.05) > first
+        await asyncio.sleep(0.1)
+        assert await backend.get("generation:salary:1") is None
+        assert await backend.incr("generation:salary:1", 0.05) > first
+
+    asyncio.run(scenario())
+
+
+def test_memory_backend_counts_generations():
+    async def scenario():
+        backend = response_cache.MemoryBackend(max_bytes=100)
+        for row_id in range(10):
+            await backend.incr(f"row:{row_id}", 0.05)
+        assert backend.size == 50
+        await asyncio.sleep(0.1)
+        await backend.get("row:0")
+        assert backend.size == 0
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_cached_list_sees_writes(username, password, get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    url = "http://localhost:8000/admin/promotions/"
+    before = requests.get(url, headers=headers, params={"limit": 1000}).json()
+    assert requests.get(url, headers=headers, params={"limit": 1000}).json() == before
+
+    promotion = requests.post("http://localhost:8000/promotions/", headers=headers, json={"employee_id": 4}).json()
+    created = requests.get(url, headers=headers, params={"limit": 1000}).json()
+    requests.delete("http://localhost:8000/promotions/{}".format(promotion["id"]), headers=headers)
+    deleted = requests.get(url, headers=headers, params={"limit": 1000}).json()
+
+    assert created == before + [promotion]
+    assert deleted == before
+
+
+def test_memory_backend_warns_with_several_workers(caplog):
+    response_cache.check_backend("memory", workers=1)
+    response_cache.check_backend("store", workers=4)
+    assert not caplog.records
+    response_cache.check_backend("memory", workers=4)
+    assert "4 workers" in caplog.text
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+import pytest
+import requests
+
+import crud
+import fill_db
+import migrations
+
+# RUN TEST
+# pytest test_salary_history.py
+
+base_url = "http://localhost:8000"
+
+months = ["2022-{:02d}-05T00:00:00".format(month) for month in range(1, 13)] + \
+         ["2023-{:02d}-05T00:00:00".format(month) for month in range(1, 13)]
+
+
+@pytest.fixture()
+def employee(get_token):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    employee = requests.post(base_url + "/admin/employees/", headers=headers,
+                             json={"username": "historian", "password": "secret"}).json()
+    salaries = [{"employee_id": employee["id"], "total": 1000 + i, "received_at": received_at}
+                for i, received_at in enumerate(months)]
+    requests.post(base_url + "/admin/salaries/bulk", headers=headers, json=salaries)
+    yield employee
+    # salaries outlive their employee
+    for salary in requests.get(base_url + "/admin/salaries/", headers=headers,
+                               params={"employee_id": employee["id"]}).json():
+        requests.delete(base_url + "/admin/salaries/{}".format(salary["id"]), headers=headers)
+    requests.delete(base_url + "/admin/employees/{}".format(employee["id"]), headers=headers)
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_salary_history(username, password, get_token, employee):
+    headers = {"Authorization": "Bearer {}".format(get_token)}
+    history_url = base_url + "/admin/employees/{}/salary/history".format(employee["id"])
+
+    received = []
+    response = requests.get(history_url, headers=headers, params={"limit": 10})
+    while True:
+        assert response.status_code == 200
+        received += [salary["received_at"] for salary in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        response = requests.get(history_url, headers=headers,
+                                params={"limit": 10, "cursor": response.headers["X-Next-Cursor"]})
+    assert received == months[::-1]
+
+    response = requests.get(history_url, headers=headers,
+                            params={"received_from": "2022-06-01T00:00:00", "received_to": "2022-09-05T00:00:00"})
+    assert [salary["total"] for salary in response.json()] == [1007, 1006, 1005]
+
+    # the salary in effect on a date
+    response = requests.get(history_url, headers=headers, params={"as_of": "2023-03-20T00:00:00", "limit": 1})
+    assert [salary["received_at"] for salary in response.json()] == ["2023-03-05T00:00:00"]
+    response = requests.get(history_url, headers=headers, params={"as_of": "2021-01-01T00:00:00", "limit": 1})
+    assert response.json() == []
+
+    assert requests.get(history_url, headers=headers, params={"cursor": "nope"}).status_code == 400
+
+
+@pytest.mark.parametrize("username,password", [("username1", "password1")])
+def test_own_salary_history(username, password, get_token, employee):
+    token = requests.post(base_url + "/token", data={"username": "historian", "password": "secret"}).json()
+    headers = {"Authorization": "Bearer {}".format(token["access_token"])}
+
+    response = requests.get(base_url + "/users/me/salary/history", headers=headers)
+    assert response.status_code == 200
+    assert [salary["received_at"] for salary in response.json()] == months[::-1]
+    assert all(salary["employee_id"] == employee["id"] for salary in response.json())
+
+    # admins only
+    response = requests.get(base_url + "/admin/employees/{}/salary/history".format(employee["id"]), headers=headers)
+    assert response.status_code == 403
+
+
+def test_history_query_plan(tmp_path):
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    migrations.upgrade(engine)
+    fill_db.generate(engine, fill_db.Distribution(employees=100, salaries_per_employee=24), seed=1,
+                     today=datetime(2024, 6, 15))
+    queries = [
+        crud.select_salary_history(42),
+        crud.select_salary_history(42, as_of=datetime(2024, 1, 1), limit=1),
+        crud.select_salary_history(42, received_from=datetime(2023, 1, 1), received_to=datetime(2024, 1, 1),
+                                   after=(datetime(2023, 6, 1), 1000)),
+    ]
+    for query in queries:
+        compiled = query.compile(dialect=engine.dialect)
+        params = [compiled.params[name] for name in compiled.positiontup]
+        params = [str(param) if isinstance(param, datetime) else param for param in params]
+        with engine.connect() as connection:
+            plan = " ".join(row[3] for row in connection.exec_driver_sql(
+                "EXPLAIN QUERY PLAN " + str(compiled), tuple(params)).all())
+        # a range seek in index order, no scan and no sort
+        assert "USING INDEX ix_salary_employee_id_received_at (employee_id=?" in plan
+        assert "SCAN" not in plan and "TEMP B-TREE" not in plan
+    engine.dispose()
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import background
+import crud
+import metrics
+import migrations
+import models
+import settings
+
+# RUN TEST
+# pytest test_settlement.py
+
+now = datetime(2024, 6, 15, 12)
+
+
+def test_settle_due(tmp_path):
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    engine = settings.create_engine(url, echo=False)
+    migrations.upgrade(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.insert(models.Salary), [
+            {"employee_id": 1, "total": 100, "received_at": now + timedelta(days=days), "is_received": False}
+            for days in range(-5, 3)])
+        connection.execute(sa.insert(models.Salary), [
+            {"employee_id": 1, "total": 100, "received_at": now - timedelta(days=10), "is_received": True}])
+        connection.execute(sa.insert(models.Promotion), [
+            {"employee_id": 1, "received_at": now - timedelta(hours=1), "is_received": False},
+            {"employee_id": 1, "received_at": now + timedelta(hours=1), "is_received": False}])
+
+    async def run():
+        async_engine = settings.create_async_db_engine(url, echo=False)
+        async with async_sessionmaker(async_engine)() as db:
+            assert await crud.settle_due(db, models.Salary, now, batch_size=2) == 6
+            assert await crud.settle_due(db, models.Salary, now, batch_size=2) == 0
+            assert await crud.settle_due(db, models.Promotion, now) == 1
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+    with engine.connect() as connection:
+        salaries = connection.execute(sa.select(models.Salary.received_at, models.Salary.is_received,
+                                                models.Salary.version)).all()
+        assert all(is_received == (received_at <= now) for received_at, is_received, _ in salaries)
+        assert sorted(version for _, _, version in salaries) == [1, 1, 1, 2, 2, 2, 2, 2, 2]
+        # the payroll summary triggers saw the updates
+        received = connection.execute(sa.select(sa.func.sum(models.PayrollSummary.salaries))
+                                      .where(models.PayrollSummary.is_received == True)).scalar()
+        assert received == 7
+        promotions = connection.execute(sa.select(models.Promotion.is_received).order_by(models.Promotion.id)).all()
+        assert [row[0] for row in promotions] == [True, False]
+    engine.dispose()
+
+
+def test_lease_has_one_holder(tmp_path):
+    url = f"sqlite:///{tmp_path / 'test.db'}"
+    migrations.upgrade(settings.create_engine(url, echo=False))
+
+    async def run():
+        async_engine = settings.create_async_db_engine(url, echo=False)
+        async with async_sessionmaker(async_engine)() as db:
+            until = now + timedelta(minutes=3)
+            assert await crud.acquire_lease(db, "due-settlement", "worker-1", now, until)
+            assert not await crud.acquire_lease(db, "due-settlement", "worker-2", now, until)
+            # the holder renews it, others take it over once it expired
+            assert await crud.acquire_lease(db, "due-settlement", "worker-1", now + timedelta(minutes=1), until)
+            assert not await crud.acquire_lease(db, "due-settlement", "worker-2", until, until)
+            assert await crud.acquire_lease(db, "due-settlement", "worker-2", until + timedelta(seconds=1),
+                                            until + timedelta(minutes=3))
+            assert await crud.acquire_lease(db, "refresh-token-sweeper", "worker-1", now, until)
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_periodic_task_records_runs():
+    runs = []
+
+    async def job():
+        runs.append(len(runs))
+        if len(runs) == 2:
+            raise RuntimeError("fails once")
+
+    async def run():
+        task = background.PeriodicTask("test-task", 0.01, job)
+        task.start()
+        await asyncio.sleep(0.1)
+        await task.stop()
+
+    asyncio.run(run())
+    assert len(runs) >= 3
+    text = metrics.render()
+    assert 'background_task_duration_seconds_count{task="test-task"}' in text
+    assert 'background_task_failures_total{task="test-task"} 1' in text